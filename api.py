@@ -1,7 +1,9 @@
 import os
-import tempfile
+import asyncio
+import functools
 import requests
-from typing import List, Tuple, Dict
+import numpy as np
+from typing import Any, Callable, List, Tuple, Dict, Optional, Iterable, Iterator
 from fastapi import FastAPI, HTTPException, Depends, Header
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
@@ -9,15 +11,55 @@ import urllib.parse
 import time
 import logging
 import re
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, asynccontextmanager
 
 from ingest.document_loader import DocumentLoader
-from retrieval.vector_store import SimpleVectorStore
-from llm.gemini_api import GeminiLLM
+from ingest.pdf_engines import PDF_ENGINE
+from ingest.pipeline import StageTimer, prefetch, iter_batches, iter_chunks_simple, iter_chunks_sentence_aware
+from ingest.downloader import DocumentDownloader, DocumentTooLarge, DownloadResult
+from retrieval.vector_store import SimpleVectorStore, ChunkTexts
+from retrieval.shared_store import SharedVectorStore
+from retrieval.index_cache import IndexDiskCache, hash_bytes
+from retrieval.state_files import file_lock
+from retrieval.cache import BoundedCache
+from llm.gemini_api import GeminiLLM, EMBED_MODEL_ID, EMBEDDING_CACHE, EMBED_BATCHER, get_embed_model, warmup_embeddings
+from llm.embed_backends import check_backend
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="InsureGenie API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARMUP_ON_STARTUP:
+        # Serve /health right away; /ready turns green once warmup() has run
+        warmup_task = asyncio.create_task(run_warmup())
+    else:
+        WARMUP_DONE.set()
+    if EMBED_BATCHER is not None:
+        # Threads inherit their creator's nice value: start the shared batcher thread here,
+        # not lazily from whichever thread embeds first, which may be the niced prefetch thread
+        EMBED_BATCHER.start()
+    manifest_lock = ExitStack()
+    if PREFETCH_MANIFEST:
+        # One worker per host works through the manifest and holds the lock until it exits;
+        # the others find its builds in the disk cache
+        if manifest_lock.enter_context(file_lock(os.path.join(INDEX_DISK_CACHE.root, "prefetch.lock"), blocking=False)):
+            try:
+                PREFETCHER.submit(read_manifest(PREFETCH_MANIFEST))
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not read prefetch manifest {PREFETCH_MANIFEST}: {e}")
+        else:
+            logger.info("Another worker is prefetching the manifest; skipping it here")
+    yield
+    if WARMUP_ON_STARTUP and not warmup_task.done():
+        warmup_task.cancel()
+    PREFETCHER.stop()
+    manifest_lock.close()
+
+app = FastAPI(title="InsureGenie API", version="1.0.0", lifespan=lifespan)
 
 security = HTTPBearer()
 
@@ -28,6 +70,10 @@ class HackRxRequest(BaseModel):
 class HackRxResponse(BaseModel):
     answers: List[str]
 
+class PrefetchRequest(BaseModel):
+    # Document URLs, or paths under PREFETCH_ROOT
+    documents: List[str]
+
 API_KEY = os.getenv("API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
@@ -35,6 +81,8 @@ if not API_KEY:
     raise RuntimeError("API_KEY environment variable not set")
 if not GOOGLE_API_KEY:
     raise RuntimeError("GOOGLE_API_KEY environment variable not set")
+# A missing ONNX dependency fails startup here rather than leaving /ready at 503
+check_backend()
 
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "800"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
@@ -43,7 +91,145 @@ SIM_THRESHOLD = float(os.getenv("SIM_THRESHOLD", "0.25"))
 ENABLE_SENTENCE_CHUNKING = os.getenv("ENABLE_SENTENCE_CHUNKING", "false").lower() == "true"
 ENABLE_SNIPPET_CLEANUP = os.getenv("ENABLE_SNIPPET_CLEANUP", "false").lower() == "true"
 CLEAN_SNIPPET_MAX_CHARS = int(os.getenv("CLEAN_SNIPPET_MAX_CHARS", "350"))
+# Chunks embedded and appended to the index per micro-batch while ingesting
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
 DEFAULT_ANSWER_MODE = os.getenv("DEFAULT_ANSWER_MODE", "clause").lower()
+# clause: top clause verbatim; compose: one Gemini call per question;
+# compose_batch: one Gemini call answering every question of the request
+ANSWER_MODES = ("clause", "compose", "compose_batch")
+# Downloads are streamed through a pooled session and capped at MAX_DOCUMENT_BYTES
+MAX_DOCUMENT_BYTES = int(os.getenv("MAX_DOCUMENT_BYTES", str(50 * 1024 * 1024)))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
+# Parse/embed/search run on CPU_WORKERS threads, downloads and Gemini calls on IO_WORKERS
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(os.cpu_count() or 2)))
+IO_WORKERS = int(os.getenv("IO_WORKERS", "16"))
+# Requests admitted at once; beyond this /hackrx/run answers 503 with Retry-After
+MAX_PENDING_REQUESTS = int(os.getenv("MAX_PENDING_REQUESTS", "32"))
+RETRY_AFTER_SECONDS = int(os.getenv("RETRY_AFTER_SECONDS", "5"))
+# Gemini calls in flight at once for one compose-mode request
+COMPOSE_CONCURRENCY = int(os.getenv("COMPOSE_CONCURRENCY", "4"))
+# process: one deduplicated in-memory SHARED_INDEX per worker process;
+# mmap: serve the memory-mapped disk-cache entry of each document, which every
+# worker attaches to and the OS page cache holds once (gunicorn.conf.py sets this)
+INDEX_SHARING = os.getenv("INDEX_SHARING", "process").lower()
+# Load the model and exercise encode + FAISS search at startup; /ready waits for it
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+# Bearer token for the admin endpoints (/admin/*), which are disabled while it is unset
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY", "")
+# File listing document URLs / paths to build in the background at startup (one per line, # comments)
+PREFETCH_MANIFEST = os.getenv("PREFETCH_MANIFEST", "")
+# Directory local prefetch paths must resolve into; unset allows URLs only
+PREFETCH_ROOT = os.getenv("PREFETCH_ROOT", "")
+# Prefetch builds run one at a time on a thread with this nice increment, after warmup and
+# only while no /hackrx/run request is in flight (re-checked every PREFETCH_IDLE_POLL_SECONDS).
+# They extract PDFs and embed on that thread rather than on the shared PDF processes and batcher
+PREFETCH_NICE = int(os.getenv("PREFETCH_NICE", "10"))
+PREFETCH_IDLE_POLL_SECONDS = float(os.getenv("PREFETCH_IDLE_POLL_SECONDS", "0.5"))
+
+CPU_EXECUTOR = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="cpu")
+IO_EXECUTOR = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+
+
+def _lower_thread_priority():
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), PREFETCH_NICE)
+    except (AttributeError, OSError) as e:
+        logger.warning(f"Could not lower prefetch thread priority: {e}")
+
+
+PREFETCH_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch",
+                                       initializer=_lower_thread_priority)
+_pending_requests = 0
+WARMUP_DONE = threading.Event()
+_warmup_error: Optional[str] = None
+
+
+async def run_cpu(fn, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(CPU_EXECUTOR, functools.partial(fn, *args, **kwargs))
+
+
+async def run_io(fn, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(IO_EXECUTOR, functools.partial(fn, *args, **kwargs))
+
+
+async def run_prefetch(fn, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(PREFETCH_EXECUTOR, functools.partial(fn, *args, **kwargs))
+
+
+@asynccontextmanager
+async def admit_request():
+    """Reject with 503 + Retry-After once MAX_PENDING_REQUESTS are already in flight."""
+    global _pending_requests
+    if _pending_requests >= MAX_PENDING_REQUESTS:
+        raise HTTPException(status_code=503, detail="Server busy, please retry",
+                            headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+    _pending_requests += 1
+    try:
+        yield
+    finally:
+        _pending_requests -= 1
+
+
+class SingleFlight:
+    """Coalesce concurrent calls per key: the first caller starts the work, later ones await it.
+
+    The work runs as its own task, so a disconnecting caller does not cancel it for the
+    others. Nothing is remembered once it finishes: results are cached elsewhere, and an
+    exception reaches every waiter while the next call starts afresh.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Any, asyncio.Task] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def run(self, key, fn, *args, **kwargs):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(functools.partial(self._finished, key))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # retrieved here, so a failure nobody awaits is not logged as lost
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._inflight), "started": self.started, "coalesced": self.coalesced}
+
+
+def warmup():
+    """Load the embedding model and Gemini client, then run a dummy encode and FAISS search."""
+    t0 = time.perf_counter()
+    GeminiLLM()
+    embs = warmup_embeddings()
+    store = SimpleVectorStore(dim=int(embs.shape[1]), metric="ip")
+    store.add_batch(embs, ["warmup"] * len(embs))
+    store.search_above(embs, TOP_K, SIM_THRESHOLD)
+    logger.info(f"Warmup finished in {time.perf_counter() - t0:.2f}s")
+
+def preload():
+    """Load the embedding weights in a pre-fork master so workers share the pages copy-on-write.
+
+    No inference runs here: the model's thread pools must start in each worker after fork.
+    """
+    get_embed_model()
+
+async def run_warmup():
+    global _warmup_error
+    try:
+        await run_cpu(warmup)
+    except Exception as e:
+        logger.exception("Warmup failed")
+        _warmup_error = str(e)
+        return
+    WARMUP_DONE.set()
 
 
 def verify_api_key(credentials: HTTPAuthorizationCredentials = Depends(security)):
@@ -51,69 +237,51 @@ def verify_api_key(credentials: HTTPAuthorizationCredentials = Depends(security)
         raise HTTPException(status_code=401, detail="Invalid API key")
     return credentials.credentials
 
-def download_document(url: str, timeout=10) -> str:
+def verify_admin_key(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_API_KEY")
+    if credentials.credentials != ADMIN_API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid admin API key")
+    return credentials.credentials
+
+def download_document(url: str, timeout=10, conditional: bool = True) -> DownloadResult:
+    """Stream ``url`` into memory; ``result.data`` is None when the server answered 304."""
     try:
-        response = requests.get(url, timeout=timeout)
-        response.raise_for_status()
-        temp_dir = tempfile.mkdtemp()
-        ext = os.path.splitext(urllib.parse.urlparse(url).path)[1] or ".pdf"
-        file_path = os.path.join(temp_dir, f"policy{ext}")
-        with open(file_path, "wb") as f:
-            f.write(response.content)
-        return temp_dir
+        return DOWNLOADER.fetch(url, timeout=timeout, conditional=conditional)
+    except DocumentTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except requests.RequestException as e:
         raise HTTPException(status_code=400, detail=f"Failed to download document: {str(e)}")
 
-# Simplified cache: keep only the FAISS index per document URL
-DOCUMENT_INDEX_CACHE: Dict[str, SimpleVectorStore] = {}
-# Answer cache per (doc_url, question, mode)
-ANSWER_CACHE: Dict[Tuple[str, str, str], str] = {}
+MB = 1024 * 1024
+
+# One index over the unique chunks of all loaded documents, keyed by content hash
+# (sha256 of the downloaded bytes); least recently used documents are dropped past the budget
+SHARED_INDEX = SharedVectorStore(max_bytes=int(os.getenv("SHARED_INDEX_MAX_BYTES", str(512 * MB))))
+# INDEX_SHARING=mmap: open memory-mapped disk-cache entries by content hash; they cost
+# address space rather than private memory, so the bound is on open entries
+MAPPED_INDEXES = BoundedCache.from_env("MAPPED_INDEX_CACHE", max_items=1024, sizeof=lambda store: 0)
+# In-process deduplication of concurrent work: per document URL (download + build)
+# and per content hash (build), so a burst of identical requests builds once
+DOCUMENT_FLIGHTS = SingleFlight("document")
+BUILD_FLIGHTS = SingleFlight("build")
+# Answer cache per (doc_hash, question, mode); limits via ANSWER_CACHE_MAX_BYTES / _MAX_ITEMS / _TTL
+ANSWER_CACHE = BoundedCache.from_env("ANSWER_CACHE", max_bytes=16 * MB)
+# Persistent copy of built indexes plus the URL -> content hash side table
+INDEX_DISK_CACHE = IndexDiskCache()
+DOWNLOADER = DocumentDownloader(MAX_DOCUMENT_BYTES, pool_size=HTTP_POOL_SIZE,
+                                state_path=os.path.join(INDEX_DISK_CACHE.root, "validators.json"))
+# Anything that changes how an index is built must invalidate persisted entries
+INDEX_SETTINGS = {
+    "chunk_size": CHUNK_SIZE,
+    "chunk_overlap": CHUNK_OVERLAP,
+    "sentence_chunking": ENABLE_SENTENCE_CHUNKING,
+    "embed_model": EMBED_MODEL_ID,
+    "pdf_engine": PDF_ENGINE,
+}
 
-SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+")
 END_PUNCT_RE = re.compile(r"[.!?]\s")
 
-def split_sentences(text: str) -> List[str]:
-    return re.split(SENTENCE_SPLIT_RE, text.strip()) if text else []
-
-def chunk_text_simple(text: str, size: int, overlap: int) -> List[str]:
-    if size <= 0:
-        return [text]
-    chunks = []
-    start = 0
-    n = len(text)
-    while start < n:
-        end = min(start + size, n)
-        chunks.append(text[start:end])
-        if end == n:
-            break
-        start = max(end - overlap, start + 1)
-    return chunks
-
-def chunk_text_sentence_aware(text: str, size: int) -> List[str]:
-    sents = split_sentences(text)
-    if not sents:
-        return [text]
-    chunks: List[str] = []
-    cur = []
-    cur_len = 0
-    for s in sents:
-        s_len = len(s)
-        if cur_len + s_len <= size or not cur:
-            cur.append(s)
-            cur_len += s_len + 1
-        else:
-            chunks.append(" ".join(cur).strip())
-            cur = [s]
-            cur_len = s_len + 1
-    if cur:
-        chunks.append(" ".join(cur).strip())
-    return chunks
-
-def chunk_text(text: str, size: int, overlap: int) -> List[str]:
-    if ENABLE_SENTENCE_CHUNKING:
-        return chunk_text_sentence_aware(text, size)
-    return chunk_text_simple(text, size, overlap)
-
 def concise(text: str, max_chars: int = CLEAN_SNIPPET_MAX_CHARS) -> str:
     t = text.strip()
     if not ENABLE_SNIPPET_CLEANUP:
@@ -137,38 +305,276 @@ def concise(text: str, max_chars: int = CLEAN_SNIPPET_MAX_CHARS) -> str:
         end_idx = start_idx + max_chars
     return t[start_idx:end_idx].strip() + ('...' if end_idx < len(t) else '')
 
-def build_index_for_dir(temp_dir: str) -> SimpleVectorStore:
-    loader = DocumentLoader(temp_dir)
-    docs = loader.load_documents()
-    raw_texts = [doc.get('text', '') for doc in docs if doc.get('text')]
-    texts: List[str] = []
-    for t in raw_texts:
-        texts.extend(chunk_text(t, CHUNK_SIZE, CHUNK_OVERLAP))
-    if not texts:
-        raise HTTPException(status_code=400, detail="No text found in the document")
+def iter_chunks(pages: Iterable[str]) -> Iterator[Tuple[int, int, str]]:
+    """Chunk the pages of one document (joined with newlines), as (start, end, text) spans."""
+    if ENABLE_SENTENCE_CHUNKING:
+        return iter_chunks_sentence_aware(pages, CHUNK_SIZE)
+    return iter_chunks_simple(pages, CHUNK_SIZE, CHUNK_OVERLAP)
+
+EmbeddingLookup = Callable[[List[str]], List[Optional[np.ndarray]]]
+
+def embed_texts(llm: GeminiLLM, texts: List[str], known: Optional[EmbeddingLookup] = None,
+                microbatch: bool = True) -> np.ndarray:
+    """llm.get_embeddings for ``texts``, skipping those ``known`` already has a vector for."""
+    if known is None:
+        return llm.get_embeddings(texts, microbatch=microbatch)
+    vectors = known(texts)
+    missing = [i for i, vec in enumerate(vectors) if vec is None]
+    if missing:
+        for i, vec in zip(missing, llm.get_embeddings([texts[i] for i in missing], microbatch=microbatch)):
+            vectors[i] = vec
+    return np.vstack(vectors).astype("float32")
+
+def build_index_streaming(documents: Iterable[Iterable[str]], known: Optional[EmbeddingLookup] = None,
+                          optimize: bool = True, low_priority: bool = False) -> SimpleVectorStore:
+    """Build an index from per-document page streams.
+
+    Pages are extracted and chunked on a prefetch thread while the caller's thread
+    embeds chunks in EMBED_BATCH_SIZE micro-batches and appends each batch to the
+    index, so extraction overlaps embedding and only one batch of vectors is held.
+    Chunks ``known`` already has a vector for are not re-embedded. With ``optimize``
+    the flat index is swapped for an ANN index when it is large enough. With
+    ``low_priority`` chunks are embedded on the calling thread, not EMBED_BATCHER's.
+    """
+    timer = StageTimer()
+    t0 = time.perf_counter()
+    # Each document's text is stored once; chunks are (doc_id, start, end) spans into it
+    chunk_texts = ChunkTexts()
+
+    def produce_chunks():
+        for pages in documents:
+            doc_id = chunk_texts.add_document()
+            parts: List[str] = []
+
+            def keep(pages):
+                for page in pages:
+                    parts.append(page)
+                    yield page
+
+            for start, end, text in iter_chunks(timer.timed(keep(pages), "extract")):
+                if text:
+                    yield doc_id, start, end, text
+            chunk_texts.set_document(doc_id, "\n".join(parts))
+
     llm = GeminiLLM()
-    if hasattr(llm, 'get_embeddings'):
-        embs = llm.get_embeddings(texts)
-    else:
-        embs = [llm.get_embedding(t) for t in texts]
-    dim = int(getattr(embs[0], 'shape', [len(embs[0])])[-1])
-    store = SimpleVectorStore(dim=dim)
-    for emb, txt in zip(embs, texts):
-        store.add(emb, txt)
+    store: Optional[SimpleVectorStore] = None
+    chunks = timer.timed(produce_chunks(), "extract+chunk")
+    for batch in iter_batches(prefetch(chunks), EMBED_BATCH_SIZE):
+        doc_ids, starts, ends, texts = zip(*batch)
+        with timer.stage("embed"):
+            embs = embed_texts(llm, list(texts), known, microbatch=not low_priority)
+        with timer.stage("index"):
+            if store is None:
+                # get_embeddings normalizes, so inner product is cosine similarity
+                store = SimpleVectorStore(dim=int(embs.shape[1]), metric="ip", texts=chunk_texts)
+            store.add_spans(embs, doc_ids, starts, ends)
+    if store is None:
+        raise HTTPException(status_code=400, detail="No text found in the document")
+    if optimize:
+        with timer.stage("optimize"):
+            store.optimize()
+    timer.totals["chunk"] = timer.totals.pop("extract+chunk", 0.0) - timer.totals.get("extract", 0.0)
+    logger.info(f"Indexed {store.index.ntotal} chunks in {time.perf_counter() - t0:.2f}s ({timer.summary()})")
     return store
 
-def search_top_texts(store: SimpleVectorStore, question: str, llm: GeminiLLM, top_k: int) -> List[str]:
-    q_emb = llm.get_embedding(question)
-    results = store.search(q_emb, top_k=top_k)
-    texts: List[str] = []
-    for txt, dist in results:
-        try:
-            sim = 1.0 - float(dist) / 2.0
-        except Exception:
-            sim = 0.0
-        if sim >= SIM_THRESHOLD:
-            texts.append(txt)
-    return texts
+def build_index_for_bytes(data: bytes, filename: str, mime: Optional[str] = None,
+                          known: Optional[EmbeddingLookup] = None, optimize: bool = True,
+                          low_priority: bool = False) -> SimpleVectorStore:
+    """Index one document; ``low_priority`` keeps all of its work on the calling thread (see PREFETCH_NICE)."""
+    pages = DocumentLoader().iter_pages(data, filename=filename, mime=mime, parallel=not low_priority)
+    if pages is None:
+        raise HTTPException(status_code=400, detail="Unsupported document type")
+    return build_index_streaming([(page['text'] for page in pages)], known, optimize, low_priority)
+
+# A store to search plus the extra search_above() arguments that select the document
+SearchTarget = Tuple[Any, dict]
+
+async def load_document(doc_hash: str) -> Optional[SearchTarget]:
+    """Search target for ``doc_hash`` if it is in memory or the disk cache, else None."""
+    if INDEX_SHARING == "mmap":
+        store = MAPPED_INDEXES.get(doc_hash)
+        if store is None:
+            store = await run_io(INDEX_DISK_CACHE.load, doc_hash, INDEX_SETTINGS)
+            if store is None:
+                return None
+            MAPPED_INDEXES[doc_hash] = store
+        return store, {}
+    if not await run_cpu(SHARED_INDEX.touch, doc_hash):
+        store = await run_io(INDEX_DISK_CACHE.load, doc_hash, INDEX_SETTINGS)
+        if store is None:
+            return None
+        await run_cpu(SHARED_INDEX.add_store, doc_hash, store)
+    return SHARED_INDEX, {"documents": [doc_hash]}
+
+async def add_built_document(doc_hash: str, store: SimpleVectorStore) -> SearchTarget:
+    """Persist a freshly built store and serve it like a cached one."""
+    await run_io(INDEX_DISK_CACHE.save, doc_hash, store, INDEX_SETTINGS)
+    if INDEX_SHARING == "mmap":
+        # Serve the shared mapping, not this worker's private copy, once it is on disk
+        mapped = await run_io(INDEX_DISK_CACHE.load, doc_hash, INDEX_SETTINGS)
+        MAPPED_INDEXES[doc_hash] = mapped if mapped is not None else store
+        return MAPPED_INDEXES[doc_hash], {}
+    await run_cpu(SHARED_INDEX.add_store, doc_hash, store)
+    return SHARED_INDEX, {"documents": [doc_hash]}
+
+async def ensure_document(url: str, low_priority: bool = False) -> Tuple[str, SearchTarget]:
+    """Load the document at ``url`` from memory, disk or a fresh build; returns its content hash and search target.
+
+    Concurrent calls for the same URL share one download and build.
+    """
+    return await DOCUMENT_FLIGHTS.run(url, _ensure_document, url, low_priority)
+
+async def build_document(doc_hash: str, data: bytes, filename: str, content_type: Optional[str],
+                         low_priority: bool = False) -> SearchTarget:
+    """Build, persist and serve the index for ``doc_hash``, once however many URLs point at the same bytes."""
+    target = await load_document(doc_hash)
+    if target is not None:
+        return target
+    t0 = time.perf_counter()
+    # Only mmap mode searches the built index itself; SHARED_INDEX copies the vectors into
+    # its flat index and scans just this document's rows, so an ANN build would be wasted
+    shared = INDEX_SHARING != "mmap"
+    known = SHARED_INDEX.lookup_embeddings if shared else None
+    run = run_prefetch if low_priority else run_cpu
+    store = await run(build_index_for_bytes, data, filename, content_type, known, optimize=not shared,
+                      low_priority=low_priority)
+    logger.info(f"Built index for {doc_hash[:12]} in {time.perf_counter() - t0:.2f}s")
+    return await add_built_document(doc_hash, store)
+
+async def _ensure_document(url: str, low_priority: bool = False) -> Tuple[str, SearchTarget]:
+    doc_hash = await run_io(INDEX_DISK_CACHE.lookup_url, url)
+    target = await load_document(doc_hash) if doc_hash else None
+    if target is not None:
+        return doc_hash, target
+
+    result = await run_io(download_document, url, timeout=10)
+    doc_hash = result.doc_hash
+    if result.not_modified:
+        # 304 Not Modified: reuse the index built from the same bytes last time
+        target = await load_document(doc_hash)
+        if target is not None:
+            await run_io(INDEX_DISK_CACHE.remember_url, url, doc_hash)
+            return doc_hash, target
+        result = await run_io(download_document, url, timeout=10, conditional=False)
+        doc_hash = result.doc_hash
+
+    filename = os.path.basename(urllib.parse.urlparse(url).path) or "policy.pdf"
+    target = await BUILD_FLIGHTS.run(doc_hash, build_document, doc_hash, result.data, filename, result.content_type,
+                                     low_priority=low_priority)
+    await run_io(INDEX_DISK_CACHE.remember_url, url, doc_hash)
+    return doc_hash, target
+
+def read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+def resolve_prefetch_path(source: str) -> str:
+    """Real path of a local prefetch source, which must lie inside PREFETCH_ROOT."""
+    if not PREFETCH_ROOT:
+        raise HTTPException(status_code=400, detail="Local paths are disabled; set PREFETCH_ROOT")
+    root = os.path.realpath(PREFETCH_ROOT)
+    path = os.path.realpath(os.path.join(root, source))
+    if os.path.commonpath([root, path]) != root:
+        raise HTTPException(status_code=400, detail=f"{source} is outside PREFETCH_ROOT")
+    return path
+
+def read_manifest(path: str) -> List[str]:
+    """Document URLs / paths from a manifest: a JSON list, or one per line with # comments."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        return [str(source) for source in json.loads(text)]
+    return [line.strip() for line in text.splitlines() if line.strip() and not line.lstrip().startswith("#")]
+
+async def prefetch_document(source: str) -> str:
+    """Build ``source`` (a URL or a path under PREFETCH_ROOT) into the index cache at low priority; returns its content hash."""
+    if urllib.parse.urlparse(source).scheme in ("http", "https"):
+        doc_hash, _ = await ensure_document(source, low_priority=True)
+        return doc_hash
+    path = resolve_prefetch_path(source)
+    try:
+        data = await run_io(read_file, path)
+    except OSError as e:
+        raise HTTPException(status_code=400, detail=f"Cannot read {source}: {e}")
+    doc_hash = hash_bytes(data)
+    # Keyed by content only: a URL serving the same bytes later finds the index after its download
+    await BUILD_FLIGHTS.run(doc_hash, build_document, doc_hash, data, os.path.basename(source), None,
+                            low_priority=True)
+    return doc_hash
+
+class Prefetcher:
+    """Builds submitted documents in the background, one at a time, yielding to live requests.
+
+    Progress is kept per source in submission order; resubmitting a finished
+    source queues it again (a cached one completes in milliseconds).
+    """
+
+    def __init__(self):
+        self.documents: Dict[str, dict] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def submit(self, sources: Iterable[str]) -> int:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        queued = 0
+        for source in sources:
+            source = source.strip()
+            if not source or self.documents.get(source, {}).get("status") in ("queued", "running"):
+                continue
+            self.documents.pop(source, None)
+            self.documents[source] = {"source": source, "status": "queued", "doc_hash": None,
+                                      "seconds": None, "error": None}
+            self._queue.put_nowait(source)
+            queued += 1
+        logger.info(f"Prefetch: queued {queued} documents")
+        return queued
+
+    async def _run(self):
+        while True:
+            source = await self._queue.get()
+            # Live traffic first: start the next build only when no request is in flight. Waiting for
+            # warmup also lets it, not the niced thread, create the model's own thread pools
+            while _pending_requests > 0 or not WARMUP_DONE.is_set():
+                await asyncio.sleep(PREFETCH_IDLE_POLL_SECONDS)
+            entry = self.documents[source]
+            entry["status"] = "running"
+            t0 = time.perf_counter()
+            try:
+                entry["doc_hash"] = await prefetch_document(source)
+                entry["status"] = "done"
+            except HTTPException as e:
+                entry["status"], entry["error"] = "failed", str(e.detail)
+            except Exception as e:
+                logger.exception(f"Prefetch of {source} failed")
+                entry["status"], entry["error"] = "failed", str(e)
+            entry["seconds"] = round(time.perf_counter() - t0, 3)
+            logger.info(f"Prefetch: {source} {entry['status']} in {entry['seconds']:.2f}s")
+
+    def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+
+    def progress(self) -> dict:
+        counts = {status: 0 for status in ("queued", "running", "done", "failed")}
+        for entry in self.documents.values():
+            counts[entry["status"]] += 1
+        return {**counts, "total": len(self.documents), "documents": list(self.documents.values())}
+
+PREFETCHER = Prefetcher()
+
+def search_top_texts_batch(store: SimpleVectorStore, questions: List[str], llm: GeminiLLM, top_k: int,
+                           **search_kwargs) -> List[List[str]]:
+    """Embed all questions in one call and run one matrix search; one text list per question.
+
+    Extra keyword arguments go to ``store.search_above``, e.g. ``documents`` for SHARED_INDEX.
+    """
+    if not questions:
+        return []
+    q_embs = llm.get_embeddings(questions, persist=False)
+    return [[txt for txt, _ in hits] for hits in store.search_above(q_embs, top_k, SIM_THRESHOLD, **search_kwargs)]
 
 def compose_answer(question: str, contexts: List[str], llm: GeminiLLM) -> str:
     context_block = "\n---\n".join(contexts[:2])
@@ -183,40 +589,91 @@ Context:
     raw = llm.answer_query(question, prompt_context)
     return raw.strip() or concise(contexts[0])
 
+async def compose_answers(questions: List[str], contexts_list: List[List[str]], llm: GeminiLLM,
+                          concurrency: int = COMPOSE_CONCURRENCY) -> List[str]:
+    """Run compose_answer for every question concurrently, at most ``concurrency`` at a time.
+
+    Answers come back in question order; a failed call falls back to the top clause.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def compose_one(question: str, contexts: List[str]) -> str:
+        async with semaphore:
+            try:
+                return await run_io(compose_answer, question, contexts, llm)
+            except Exception:
+                logger.exception("Compose failed; falling back to clause")
+                return concise(contexts[0])
+
+    return list(await asyncio.gather(*(compose_one(q, c) for q, c in zip(questions, contexts_list))))
+
+def compose_answers_batch(questions: List[str], contexts_list: List[List[str]], llm: GeminiLLM) -> List[str]:
+    """Answer all questions with one prompt over the de-duplicated union of their clauses.
+
+    Questions the model's JSON leaves unanswered fall back to clause mode.
+    """
+    clauses = list(dict.fromkeys(c for contexts in contexts_list for c in contexts[:2]))
+    try:
+        raw_answers = llm.answer_queries(questions, clauses)
+    except Exception:
+        logger.exception("Batch compose failed; falling back to clause")
+        raw_answers = [None] * len(questions)
+    return [raw or concise(contexts[0]) for raw, contexts in zip(raw_answers, contexts_list)]
+
 @app.post("/hackrx/run", response_model=HackRxResponse)
 async def hackrx_run(request: HackRxRequest, api_key: str = Depends(verify_api_key), answer_mode: str = Header(default=None, alias="X-Answer-Mode")):
+    async with admit_request():
+        return await _hackrx_run(request, answer_mode)
+
+async def _hackrx_run(request: HackRxRequest, answer_mode: str) -> HackRxResponse:
     try:
         mode = (answer_mode or DEFAULT_ANSWER_MODE).lower()
-        if mode not in ("clause", "compose"):
+        if mode not in ANSWER_MODES:
             mode = "clause"
 
-        if request.documents in DOCUMENT_INDEX_CACHE:
-            store = DOCUMENT_INDEX_CACHE[request.documents]
-        else:
-            temp_dir = download_document(request.documents, timeout=10)
-            store = build_index_for_dir(temp_dir)
-            DOCUMENT_INDEX_CACHE[request.documents] = store
-            import shutil
-            shutil.rmtree(temp_dir, ignore_errors=True)
-
-        answers: List[str] = []
-        llm = GeminiLLM()
-        for question in request.questions:
-            cache_key = (request.documents, question.strip().lower(), mode)
-            if cache_key in ANSWER_CACHE:
-                answers.append(ANSWER_CACHE[cache_key])
-                continue
+        doc_hash, (store, search_kwargs) = await ensure_document(request.documents)
 
-            top_texts = search_top_texts(store, question, llm, top_k=TOP_K if mode == "clause" else max(1, min(2, TOP_K)))
-            if not top_texts:
-                final = "No relevant content found for this question."
-            elif mode == "clause":
-                final = concise(top_texts[0])
+        answers: List[Optional[str]] = [None] * len(request.questions)
+        # cache_key -> positions of the questions that share it, in first-seen order
+        pending: Dict[Tuple[str, str, str], List[int]] = {}
+        for i, question in enumerate(request.questions):
+            cache_key = (doc_hash, question.strip().lower(), mode)
+            cached = ANSWER_CACHE.get(cache_key)
+            if cached is not None:
+                answers[i] = cached
             else:
-                final = compose_answer(question, top_texts, llm)
-
-            ANSWER_CACHE[cache_key] = final
-            answers.append(final)
+                pending.setdefault(cache_key, []).append(i)
+
+        if pending:
+            llm = GeminiLLM()
+            miss_keys = list(pending)
+            miss_questions = [request.questions[pending[key][0]] for key in miss_keys]
+            top_k = TOP_K if mode == "clause" else max(1, min(2, TOP_K))
+            top_texts_list = await run_cpu(search_top_texts_batch, store, miss_questions, llm,
+                                           top_k=top_k, **search_kwargs)
+            finals: List[Optional[str]] = [None] * len(miss_keys)
+            compose_idx: List[int] = []
+            for j, top_texts in enumerate(top_texts_list):
+                if not top_texts:
+                    finals[j] = "No relevant content found for this question."
+                elif mode == "clause":
+                    finals[j] = concise(top_texts[0])
+                else:
+                    compose_idx.append(j)
+            if compose_idx:
+                compose_questions = [miss_questions[j] for j in compose_idx]
+                compose_contexts = [top_texts_list[j] for j in compose_idx]
+                if mode == "compose_batch":
+                    composed = await run_io(compose_answers_batch, compose_questions, compose_contexts, llm)
+                else:
+                    composed = await compose_answers(compose_questions, compose_contexts, llm)
+                for j, final in zip(compose_idx, composed):
+                    finals[j] = final
+
+            for cache_key, final in zip(miss_keys, finals):
+                ANSWER_CACHE[cache_key] = final
+                for i in pending[cache_key]:
+                    answers[i] = final
 
         return HackRxResponse(answers=answers)
 
@@ -234,6 +691,36 @@ async def hackrx_run_v1(request: HackRxRequest, api_key: str = Depends(verify_ap
 async def health_check():
     return {"status": "healthy", "service": "InsureGenie API"}
 
+@app.get("/ready")
+async def ready_check():
+    """Readiness probe: 503 until startup warmup has finished, so load balancers skip cold workers."""
+    if not WARMUP_DONE.is_set():
+        detail = f"Warmup failed: {_warmup_error}" if _warmup_error else "Warming up"
+        raise HTTPException(status_code=503, detail=detail)
+    return {"status": "ready", "service": "InsureGenie API"}
+
+@app.post("/admin/prefetch")
+async def admin_prefetch(request: PrefetchRequest, api_key: str = Depends(verify_admin_key)):
+    """Queue documents for background index builds; poll GET /admin/prefetch for progress."""
+    queued = PREFETCHER.submit(request.documents)
+    return {"queued": queued, **PREFETCHER.progress()}
+
+@app.get("/admin/prefetch")
+async def admin_prefetch_progress(api_key: str = Depends(verify_admin_key)):
+    return PREFETCHER.progress()
+
+@app.get("/stats")
+async def stats(api_key: str = Depends(verify_api_key)):
+    return {
+        "caches": {
+            "document_index": MAPPED_INDEXES.stats() if INDEX_SHARING == "mmap" else SHARED_INDEX.stats(),
+            "answer": ANSWER_CACHE.stats(),
+            "embedding_db": EMBEDDING_CACHE.stats() if EMBEDDING_CACHE is not None else None,
+        },
+        "embedding_batcher": EMBED_BATCHER.stats() if EMBED_BATCHER is not None else None,
+        "single_flight": {"document": DOCUMENT_FLIGHTS.stats(), "build": BUILD_FLIGHTS.stats()},
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
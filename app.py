@@ -1,6 +1,4 @@
 import streamlit as st
-import os
-import tempfile
 # Assuming you have these files from your original setup
 from ingest.document_loader import DocumentLoader
 from retrieval.vector_store import SimpleVectorStore
@@ -157,21 +155,15 @@ if is_loading:
     # Process files if they were passed in this exchange
     if "temp_files" in st.session_state and st.session_state.temp_files:
         with st.spinner("Analyzing documents..."):
-            temp_dir = tempfile.mkdtemp()
-            for uploaded_file in st.session_state.temp_files:
-                file_path = os.path.join(temp_dir, uploaded_file.name)
-                with open(file_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-            
-            loader = DocumentLoader(temp_dir)
-            docs = loader.load_documents()
+            loader = DocumentLoader()
+            docs = loader.load_sources(st.session_state.temp_files)
             chunks = [doc['text'] for doc in docs if doc['text']]
             llm = st.session_state['llm']
-            embeddings = [llm.get_embedding(chunk) for chunk in chunks]
-            store = SimpleVectorStore(dim=768)
-            for emb, chunk in zip(embeddings, chunks):
-                store.add(emb, chunk)
-            st.session_state['vector_store'] = store
+            if chunks:
+                embeddings = llm.get_embeddings(chunks)
+                store = SimpleVectorStore(dim=int(embeddings.shape[1]))
+                store.add_batch(embeddings, chunks)
+                st.session_state['vector_store'] = store
         del st.session_state.temp_files # Clean up after processing
 
     # Generate answer
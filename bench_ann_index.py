@@ -0,0 +1,51 @@
+import os
+import time
+
+import numpy as np
+
+from retrieval.vector_store import SimpleVectorStore
+
+# Recall@k and latency of the ANN index types against the exact flat index.
+# Synthetic clustered, normalized vectors stand in for chunk embeddings of a
+# multi-policy corpus (MiniLM dimension by default).
+N_VECTORS = int(os.getenv("BENCH_N", "100000"))
+DIM = int(os.getenv("BENCH_DIM", "384"))
+N_QUERIES = int(os.getenv("BENCH_QUERIES", "1000"))
+TOP_K = int(os.getenv("BENCH_TOP_K", "5"))
+N_CLUSTERS = int(os.getenv("BENCH_CLUSTERS", "500"))
+
+
+def normalized(x: np.ndarray) -> np.ndarray:
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype("float32")
+
+
+rng = np.random.default_rng(0)
+centers = rng.standard_normal((N_CLUSTERS, DIM))
+assign = rng.integers(0, N_CLUSTERS, N_VECTORS)
+vectors = normalized(centers[assign] + 0.5 * rng.standard_normal((N_VECTORS, DIM)))
+queries = normalized(centers[rng.integers(0, N_CLUSTERS, N_QUERIES)] + 0.5 * rng.standard_normal((N_QUERIES, DIM)))
+texts = [str(i) for i in range(N_VECTORS)]
+
+print("=== ANN Index Benchmark ===")
+print(f"{N_VECTORS} vectors x {DIM} dims, {N_QUERIES} queries, recall@{TOP_K}")
+print("=" * 72)
+print(f"{'index':<8}{'build s':>10}{'query ms':>12}{'recall':>10}{'MiB':>10}")
+
+truth = None
+for index_type in ("flat", "hnsw", "ivf", "ivfpq"):
+    store = SimpleVectorStore(dim=DIM, metric="ip")
+    t0 = time.perf_counter()
+    store.add_batch(vectors, texts)
+    store.optimize(index_type)
+    build = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    _, ids = store.index.search(queries, TOP_K)
+    per_query_ms = (time.perf_counter() - t0) / N_QUERIES * 1000
+    if truth is None:
+        truth = ids
+    recall = np.mean([len(set(a) & set(b)) / TOP_K for a, b in zip(ids, truth)])
+    print(f"{store.index_type:<8}{build:>10.2f}{per_query_ms:>12.3f}{recall:>10.3f}{store.nbytes() / 2**20:>10.1f}")
+
+print("=" * 72)
+print("Tune with HNSW_EF_SEARCH / IVF_NPROBE / PQ_M / IVFPQ_REFINE_K_FACTOR; query ms is a batched search divided by the query count")
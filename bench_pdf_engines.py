@@ -0,0 +1,45 @@
+import os
+import sys
+import time
+from collections import Counter
+
+from ingest.pdf_engines import ENGINES, extract_pdf_pages, pdf_page_count
+
+# Compare PDF text-extraction engines on the bundled policy wording
+PDF_PATH = sys.argv[1] if len(sys.argv) > 1 else os.path.join("docs", "ICIHLIP22012V012223.pdf")
+REPEATS = int(os.getenv("BENCH_REPEATS", "3"))
+
+
+def word_overlap(a: str, b: str) -> float:
+    wa, wb = Counter(a.split()), Counter(b.split())
+    total = max(sum(wa.values()), sum(wb.values()), 1)
+    return sum((wa & wb).values()) / total
+
+
+with open(PDF_PATH, "rb") as f:
+    data = f.read()
+n_pages = pdf_page_count(data, "pdfplumber")
+
+print("=== PDF Engine Benchmark ===")
+print(f"File: {PDF_PATH} ({len(data) / 1024:.0f} KiB, {n_pages} pages, best of {REPEATS})")
+print("=" * 72)
+print(f"{'engine':<12}{'seconds':>10}{'pages/s':>10}{'chars':>10}{'fallback':>10}{'overlap':>12}")
+
+reference = None
+for engine in ["pdfplumber"] + [e for e in ENGINES if e != "pdfplumber"] + ["auto"]:
+    best = float("inf")
+    for _ in range(REPEATS):
+        t0 = time.perf_counter()
+        results = extract_pdf_pages(data, 0, n_pages, engine)
+        best = min(best, time.perf_counter() - t0)
+    text = "\n".join(t for t, _ in results)
+    if reference is None:
+        reference = text
+    fallback = sum(1 for _, used in results if used == "pdfplumber") if engine == "auto" else 0
+    print(f"{engine:<12}{best:>10.2f}{n_pages / best:>10.1f}{len(text):>10}{fallback:>10}"
+          f"{word_overlap(reference, text):>12.3f}")
+
+print("=" * 72)
+print("overlap: share of pdfplumber's words also produced by the engine")
+if "pypdf" not in ENGINES:
+    print("pypdf is not installed; 'auto' ran on pdfplumber only (pip install pypdf)")
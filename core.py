@@ -1,10 +1,11 @@
 from ingest.document_loader import DocumentLoader
 from retrieval.vector_store import SimpleVectorStore
 from llm.gemini_api import GeminiLLM
-import tempfile
-import os
+from retrieval.cache import BoundedCache
+from retrieval.index_cache import hash_bytes
 import time
 import logging
+import numpy as np
 
 # Use monotonic clock for timeouts
 now = time.perf_counter
@@ -13,40 +14,33 @@ now = time.perf_counter
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Global cache for embeddings and processed documents
-_embedding_cache = {}
-_document_cache = {}
+MB = 1024 * 1024
+
+# Global caches for embeddings and processed documents; limits via
+# EMBEDDING_CACHE_* and DOCUMENT_CACHE_* (_MAX_BYTES / _MAX_ITEMS / _TTL)
+_embedding_cache = BoundedCache.from_env("EMBEDDING_CACHE", max_bytes=64 * MB)
+_document_cache = BoundedCache.from_env("DOCUMENT_CACHE", max_bytes=128 * MB)
 
 # Removed lru_cache to avoid hashing non-hashable LLM instances
 def get_cached_embedding(text, llm):
-    if text not in _embedding_cache:
-        _embedding_cache[text] = llm.get_embedding(text)
-    return _embedding_cache[text]
+    emb = _embedding_cache.get(text)
+    if emb is None:
+        emb = llm.get_embedding(text)
+        _embedding_cache[text] = emb
+    return emb
 
 def process_query(uploaded_files, user_query, embedding_dim=768, top_k=1, timeout=14, fast_no_llm=True):
     start_time = now()
-    temp_dir = tempfile.mkdtemp()
 
     try:
         if now() - start_time > timeout:
             return {'answer': 'Processing timeout. Please try again.', 'matched_clauses': [], 'rationale': ''}
 
-        # Save uploaded files to temp dir
-        for uploaded_file in uploaded_files:
-            file_path = os.path.join(temp_dir, uploaded_file.name)
-            with open(file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-
-        if now() - start_time > timeout:
-            return {'answer': 'Processing timeout. Please try again.', 'matched_clauses': [], 'rationale': ''}
-
-        # Load and limit chunks for speed
-        cache_key = f"{temp_dir}_{len(uploaded_files)}"
-        if cache_key in _document_cache:
-            docs = _document_cache[cache_key]
-        else:
-            loader = DocumentLoader(temp_dir)
-            docs = loader.load_documents()
+        # Parse uploaded files straight from their in-memory buffers
+        cache_key = tuple((f.name, hash_bytes(f.getbuffer())) for f in uploaded_files)
+        docs = _document_cache.get(cache_key)
+        if docs is None:
+            docs = DocumentLoader().load_sources(uploaded_files)
             _document_cache[cache_key] = docs
 
         chunks = [doc.get('text', '') for doc in docs if doc.get('text')]
@@ -63,17 +57,13 @@ def process_query(uploaded_files, user_query, embedding_dim=768, top_k=1, timeou
         if now() - start_time > timeout:
             return {'answer': 'Processing timeout. Please try again.', 'matched_clauses': [], 'rationale': ''}
         if hasattr(llm, 'get_embeddings'):
-            import numpy as np
             chunk_embs = llm.get_embeddings(chunks)
         else:
             # Fallback to per-chunk
-            chunk_embs = [get_cached_embedding(c, llm) for c in chunks]
-
-        inferred_dim = int(getattr(chunk_embs[0], 'shape', [len(chunk_embs[0])])[-1])
+            chunk_embs = np.vstack([get_cached_embedding(c, llm) for c in chunks])
 
-        store = SimpleVectorStore(dim=inferred_dim)
-        for emb, chunk in zip(chunk_embs, chunks):
-            store.add(emb, chunk)
+        store = SimpleVectorStore(dim=int(chunk_embs.shape[1]))
+        store.add_batch(chunk_embs, chunks)
 
         if now() - start_time > timeout:
             return {'answer': 'Processing timeout. Please try again.', 'matched_clauses': [], 'rationale': ''}
@@ -121,13 +111,3 @@ def process_query(uploaded_files, user_query, embedding_dim=768, top_k=1, timeou
         logger.exception("Processing error")
         msg = str(e) or 'Unknown error (see server logs).'
         return {'answer': f'Error processing request: {msg}', 'matched_clauses': [], 'rationale': ''}
-    finally:
-        for fname in os.listdir(temp_dir):
-            try:
-                os.remove(os.path.join(temp_dir, fname))
-            except Exception:
-                pass
-        try:
-            os.rmdir(temp_dir)
-        except Exception:
-            pass
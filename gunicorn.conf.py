@@ -0,0 +1,23 @@
+import os
+
+# Multi-worker serving: gunicorn -c gunicorn.conf.py api:app
+#
+# The app is imported and the embedding model loaded once in the master, then
+# workers are forked so the weights are shared copy-on-write. Indexes are served
+# from the memory-mapped disk cache (INDEX_SHARING=mmap), so a policy indexed by
+# one worker is picked up by the others from the cache directory and held once
+# in the OS page cache.
+os.environ.setdefault("INDEX_SHARING", "mmap")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+
+def when_ready(server):
+    # Runs in the master after the app import and before the first fork
+    import api
+    api.preload()
+    server.log.info("Embedding model loaded before fork")
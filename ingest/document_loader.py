@@ -1,11 +1,106 @@
-import pdfplumber
 import docx
+import io
 import os
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from email import policy
 from email.parser import BytesParser
 
+from ingest.pdf_engines import extract_pdf_pages, pdf_page_count
+
+logger = logging.getLogger(__name__)
+
+# PDFs with at least PDF_PARALLEL_MIN_PAGES pages are split into page ranges
+# and extracted on PDF_WORKERS processes; smaller ones stay on the serial path
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', str(os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', '32'))
+PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', '16'))
+
+_pdf_executor = None
+_pdf_executor_lock = threading.Lock()
+
+_EXT_TYPES = {'.pdf': 'pdf', '.docx': 'docx', '.eml': 'email'}
+_MIME_TYPES = {
+    'application/pdf': 'pdf',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': 'docx',
+    'message/rfc822': 'email',
+}
+
+
+def detect_type(filename=None, mime=None, head=b''):
+    """Document type from the filename extension, then the MIME hint, then magic bytes."""
+    if filename:
+        doc_type = _EXT_TYPES.get(os.path.splitext(filename)[1].lower())
+        if doc_type:
+            return doc_type
+    if mime:
+        doc_type = _MIME_TYPES.get(mime.split(';')[0].strip().lower())
+        if doc_type:
+            return doc_type
+    if head.startswith(b'%PDF'):
+        return 'pdf'
+    if head.startswith(b'PK\x03\x04'):
+        return 'docx'
+    return None
+
+
+def _as_stream(source):
+    """Wrap bytes/bytearray/memoryview in a BytesIO; rewind file-like objects."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    source.seek(0)
+    return source
+
+
+def _get_pdf_executor():
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is None:
+            # spawn: the API process runs thread pools, which fork does not play well with
+            _pdf_executor = ProcessPoolExecutor(max_workers=PDF_WORKERS,
+                                                mp_context=multiprocessing.get_context('spawn'))
+        return _pdf_executor
+
+
+def _discard_pdf_executor(executor):
+    """Forget a broken pool so the next document starts a fresh one."""
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is executor:
+            _pdf_executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _extract_page_range(source, start, end):
+    """Worker entry point: (text, engine) of pages [start, end) of a PDF path or bytes."""
+    return extract_pdf_pages(source, start, end)
+
+
+def _pool_batches(source, ranges):
+    """
+    Page-range results from the PDF process pool, in order. If a worker dies
+    (e.g. OOM-killed) the pool is replaced for later documents and the rest of
+    this one is extracted serially.
+    """
+    executor = _get_pdf_executor()
+    done = 0
+    try:
+        futures = [executor.submit(_extract_page_range, source, start, end) for start, end in ranges]
+        for future in futures:
+            yield future.result()
+            done += 1
+    except BrokenProcessPool:
+        logger.warning(f"PDF worker pool broke; extracting pages {ranges[done][0] + 1}+ serially")
+        _discard_pdf_executor(executor)
+    for start, end in ranges[done:]:
+        yield extract_pdf_pages(source, start, end)
+
+
 class DocumentLoader:
-    def __init__(self, docs_folder):
+    def __init__(self, docs_folder=None):
         self.docs_folder = docs_folder
 
     def load_documents(self):
@@ -20,18 +115,89 @@ class DocumentLoader:
                 docs.append(self._load_email(fpath))
         return docs
 
-    def _load_pdf(self, path):
-        with pdfplumber.open(path) as pdf:
-            text = '\n'.join(page.extract_text() or '' for page in pdf.pages)
-        return {'type': 'pdf', 'path': path, 'text': text}
+    def load_bytes(self, data, filename=None, mime=None):
+        """
+        Parse an in-memory document (bytes, BytesIO, memoryview or any seekable
+        binary file object). Returns None when the type cannot be determined.
+        """
+        stream = _as_stream(data)
+        head = stream.read(8)
+        stream.seek(0)
+        doc_type = detect_type(filename, mime, head)
+        name = filename or '<memory>'
+        if doc_type == 'pdf':
+            return self._load_pdf(stream, name)
+        if doc_type == 'docx':
+            return self._load_docx(stream, name)
+        if doc_type == 'email':
+            return self._load_email(stream, name)
+        return None
+
+    def iter_pages(self, data, filename=None, mime=None, parallel=True):
+        """
+        Page-by-page variant of load_bytes: returns an iterator of
+        {'page', 'text'[, 'engine']} dicts, or None when the type is unknown.
+        PDF pages are produced in order as their page ranges finish extracting;
+        DOCX and email yield a single page. parallel=False keeps large PDFs on
+        the calling thread instead of the shared PDF_WORKERS processes.
+        """
+        stream = _as_stream(data)
+        head = stream.read(8)
+        stream.seek(0)
+        doc_type = detect_type(filename, mime, head)
+        if doc_type == 'pdf':
+            return self._iter_pdf_pages(stream, parallel)
+        if doc_type == 'docx':
+            return iter([{'page': 1, 'text': self._load_docx(stream, filename)['text']}])
+        if doc_type == 'email':
+            return iter([{'page': 1, 'text': self._load_email(stream, filename)['text']}])
+        return None
+
+    def load_sources(self, sources):
+        """Parse uploaded files (objects with ``name`` and ``getbuffer()``, e.g. Streamlit's UploadedFile)."""
+        docs = []
+        for source in sources:
+            doc = self.load_bytes(source.getbuffer(), filename=source.name, mime=getattr(source, 'type', None))
+            if doc is not None:
+                docs.append(doc)
+        return docs
+
+    def _load_pdf(self, path, name=None):
+        pages = list(self._iter_pdf_pages(path))
+        text = '\n'.join(p['text'] for p in pages)
+        return {'type': 'pdf', 'path': name or path, 'text': text, 'pages': pages}
+
+    def _iter_pdf_pages(self, path, parallel=True):
+        n_pages = pdf_page_count(path)
+        step = max(1, PDF_PAGES_PER_TASK)
+        ranges = [(start, min(start + step, n_pages)) for start in range(0, n_pages, step)]
+        if not parallel or PDF_WORKERS <= 1 or n_pages < PDF_PARALLEL_MIN_PAGES:
+            batches = (extract_pdf_pages(path, start, end) for start, end in ranges)
+        else:
+            batches = _pool_batches(self._picklable_source(path), ranges)
+        page_no = 0
+        for results in batches:
+            for text, engine in results:
+                page_no += 1
+                yield {'page': page_no, 'text': text, 'engine': engine}
+
+    def _picklable_source(self, path):
+        # Workers get the file path or the raw bytes; open handles cannot be pickled
+        if isinstance(path, str):
+            return path
+        stream = _as_stream(path)
+        return stream.getvalue() if hasattr(stream, 'getvalue') else stream.read()
 
-    def _load_docx(self, path):
+    def _load_docx(self, path, name=None):
         doc = docx.Document(path)
         text = '\n'.join([p.text for p in doc.paragraphs])
-        return {'type': 'docx', 'path': path, 'text': text}
+        return {'type': 'docx', 'path': name or path, 'text': text}
 
-    def _load_email(self, path):
-        with open(path, 'rb') as f:
-            msg = BytesParser(policy=policy.default).parse(f)
+    def _load_email(self, path, name=None):
+        if isinstance(path, str):
+            with open(path, 'rb') as f:
+                msg = BytesParser(policy=policy.default).parse(f)
+        else:
+            msg = BytesParser(policy=policy.default).parse(path)
         text = msg.get_body(preferencelist=('plain')).get_content() if msg.get_body() else ''
-        return {'type': 'email', 'path': path, 'text': text}
+        return {'type': 'email', 'path': name or path, 'text': text}
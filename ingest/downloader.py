@@ -0,0 +1,141 @@
+import hashlib
+import io
+import logging
+import os
+import threading
+import urllib.parse
+from typing import Dict, NamedTuple, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from retrieval.state_files import locked_json_update, read_json
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentTooLarge(Exception):
+    pass
+
+
+class DownloadResult(NamedTuple):
+    doc_hash: str
+    # None when the server answered 304 Not Modified and no body was read
+    data: Optional[bytes]
+    content_type: Optional[str] = None
+
+    @property
+    def not_modified(self) -> bool:
+        return self.data is None
+
+
+def resource_key(url: str) -> str:
+    """URL without its query string, so rotating SAS tokens map to one resource."""
+    parts = urllib.parse.urlsplit(url)
+    return urllib.parse.urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
+
+
+class DocumentDownloader:
+    """Pooled HTTP client that streams documents into memory.
+
+    Bodies are read in ``chunk_size`` pieces, hashed on the fly and capped at
+    ``max_bytes``. The ETag / Last-Modified of every download is remembered (and
+    persisted to ``state_path`` if given) so the next fetch of the same resource
+    can be a conditional GET; a 304 returns the known content hash without a body.
+    Worker processes sharing ``state_path`` merge their entries into it under an
+    flock on ``<state_path>.lock`` and pick up each other's on a miss.
+    """
+
+    def __init__(self, max_bytes: int, pool_size: int = 10, chunk_size: int = 64 * 1024,
+                 state_path: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.state_path = state_path
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        # resource_key -> {"url", "etag", "last_modified", "doc_hash"}
+        self._validators: Dict[str, dict] = {}
+        self._state_mtime = None
+        self._load_state()
+
+    def _load_state(self):
+        """Re-read ``state_path`` if another process changed it; caller holds _lock (or is __init__)."""
+        if not self.state_path:
+            return
+        try:
+            mtime = os.stat(self.state_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._state_mtime:
+            self._validators = read_json(self.state_path)
+            self._state_mtime = mtime
+
+    def _known(self, url: str) -> Optional[dict]:
+        key = resource_key(url)
+        with self._lock:
+            if key not in self._validators:
+                self._load_state()
+            return self._validators.get(key)
+
+    def _conditional_headers(self, url: str) -> Dict[str, str]:
+        known = self._known(url)
+        if not known:
+            return {}
+        headers = {}
+        if known.get("etag"):
+            headers["If-None-Match"] = known["etag"]
+        # Timestamps are too coarse to trust across different query strings
+        if known.get("last_modified") and known.get("url") == url:
+            headers["If-Modified-Since"] = known["last_modified"]
+        return headers
+
+    def _remember(self, url: str, response: requests.Response, doc_hash: str):
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        key = resource_key(url)
+        entry = {"url": url, "etag": etag, "last_modified": last_modified, "doc_hash": doc_hash}
+        with self._lock:
+            if not self.state_path:
+                self._validators[key] = entry
+                return
+            try:
+                # Merge into what other workers wrote instead of overwriting it
+                self._validators = locked_json_update(self.state_path, lambda validators: {**validators, key: entry})
+                self._state_mtime = os.stat(self.state_path).st_mtime_ns
+            except OSError:
+                self._validators[key] = entry
+                logger.warning("Could not persist validator state to %s", self.state_path)
+
+    def fetch(self, url: str, timeout=10, conditional: bool = True) -> DownloadResult:
+        headers = self._conditional_headers(url) if conditional else {}
+        with self.session.get(url, headers=headers, timeout=timeout, stream=True) as response:
+            if response.status_code == 304:
+                known = self._known(url) if headers else None
+                if known:
+                    return DownloadResult(known["doc_hash"], None)
+                if not headers:
+                    raise requests.HTTPError(f"304 Not Modified for unconditional GET of {url}", response=response)
+            else:
+                response.raise_for_status()
+                length = response.headers.get("Content-Length")
+                if length and length.isdigit() and int(length) > self.max_bytes:
+                    raise DocumentTooLarge(f"Document is {length} bytes; limit is {self.max_bytes}")
+                hasher = hashlib.sha256()
+                buf = io.BytesIO()
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    if buf.tell() + len(chunk) > self.max_bytes:
+                        raise DocumentTooLarge(f"Document exceeds the {self.max_bytes} byte limit")
+                    hasher.update(chunk)
+                    buf.write(chunk)
+                doc_hash = hasher.hexdigest()
+                self._remember(url, response, doc_hash)
+        if response.status_code == 304:
+            # The validators were dropped after the headers were built, so there is no hash to reuse
+            logger.info("304 for %s without a known hash; refetching unconditionally", url)
+            return self.fetch(url, timeout, conditional=False)
+        return DownloadResult(doc_hash, buf.getvalue(), response.headers.get("Content-Type"))
@@ -0,0 +1,122 @@
+import io
+import os
+import logging
+from typing import List, Optional, Tuple
+
+import pdfplumber
+
+try:
+    import pypdf
+except ImportError:  # optional fast path
+    pypdf = None
+
+logger = logging.getLogger(__name__)
+
+# auto: fast text-only engine first, pdfplumber for pages that fail the quality check
+PDF_ENGINE = os.getenv('PDF_ENGINE', 'auto').lower()
+# Pages with less text than this are re-extracted with pdfplumber in auto mode
+PDF_MIN_PAGE_CHARS = int(os.getenv('PDF_MIN_PAGE_CHARS', '20'))
+
+
+def _open_source(source):
+    """Paths pass through; bytes-like become a BytesIO; streams are rewound."""
+    if isinstance(source, str):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    source.seek(0)
+    return source
+
+
+class PdfplumberEngine:
+    """Full layout analysis per character: slow but accurate."""
+    name = 'pdfplumber'
+
+    def page_count(self, source) -> int:
+        with pdfplumber.open(_open_source(source)) as pdf:
+            return len(pdf.pages)
+
+    def extract(self, source, page_numbers) -> List[str]:
+        with pdfplumber.open(_open_source(source)) as pdf:
+            return [pdf.pages[i].extract_text() or '' for i in page_numbers]
+
+
+class PypdfEngine:
+    """Text-only extraction from the content stream, no layout analysis."""
+    name = 'pypdf'
+
+    def page_count(self, source) -> int:
+        return len(pypdf.PdfReader(_open_source(source)).pages)
+
+    def extract(self, source, page_numbers) -> List[str]:
+        reader = pypdf.PdfReader(_open_source(source))
+        texts = []
+        for i in page_numbers:
+            try:
+                texts.append(reader.pages[i].extract_text() or '')
+            except Exception:
+                logger.warning("pypdf failed on page %d", i + 1)
+                texts.append('')
+        return texts
+
+
+ENGINES = {'pdfplumber': PdfplumberEngine()}
+if pypdf is not None:
+    ENGINES['pypdf'] = PypdfEngine()
+
+
+def page_text_ok(text: str, min_chars: int = PDF_MIN_PAGE_CHARS) -> bool:
+    """Heuristic for usable extraction: enough text, few undecodable glyphs, mostly words."""
+    stripped = text.strip()
+    if len(stripped) < min_chars:
+        return False
+    bad = stripped.count('�') + 5 * stripped.count('(cid:')
+    if bad > 0.02 * len(stripped):
+        return False
+    visible = [ch for ch in stripped if not ch.isspace()]
+    if sum(ch.isprintable() for ch in visible) < 0.95 * len(visible):
+        return False
+    return sum(ch.isalnum() for ch in visible) >= 0.5 * len(visible)
+
+
+def resolve_engine(name: Optional[str] = None) -> str:
+    name = (name or PDF_ENGINE).lower()
+    if name == 'auto':
+        return name if 'pypdf' in ENGINES else 'pdfplumber'
+    if name not in ENGINES:
+        logger.warning("PDF engine %r unavailable; using pdfplumber", name)
+        return 'pdfplumber'
+    return name
+
+
+def pdf_page_count(source, engine: Optional[str] = None) -> int:
+    engine = resolve_engine(engine)
+    if engine != 'auto':
+        return ENGINES[engine].page_count(source)
+    try:
+        return ENGINES['pypdf'].page_count(source)
+    except Exception as e:
+        logger.warning("pypdf could not open the PDF (%s); counting pages with pdfplumber", e)
+        return ENGINES['pdfplumber'].page_count(source)
+
+
+def extract_pdf_pages(source, start: int, end: int, engine: Optional[str] = None) -> List[Tuple[str, str]]:
+    """
+    (text, engine name) for pages [start, end); auto mode falls back per page to
+    pdfplumber, and for the whole range when pypdf cannot open the file.
+    """
+    engine = resolve_engine(engine)
+    page_numbers = list(range(start, end))
+    if engine != 'auto':
+        return [(t, engine) for t in ENGINES[engine].extract(source, page_numbers)]
+    try:
+        results = [(t, 'pypdf') for t in ENGINES['pypdf'].extract(source, page_numbers)]
+    except Exception as e:
+        logger.warning("pypdf could not open the PDF (%s); extracting pages %d-%d with pdfplumber", e, start + 1, end)
+        return [(t, 'pdfplumber') for t in ENGINES['pdfplumber'].extract(source, page_numbers)]
+    retry = [j for j, (t, _) in enumerate(results) if not page_text_ok(t)]
+    if retry:
+        fallback = ENGINES['pdfplumber'].extract(source, [page_numbers[j] for j in retry])
+        for j, text in zip(retry, fallback):
+            results[j] = (text, 'pdfplumber')
+    return results
@@ -0,0 +1,191 @@
+import queue
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Tuple
+
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+class StageTimer:
+    """Accumulates busy time per pipeline stage."""
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.totals[name] += time.perf_counter() - t0
+
+    def timed(self, iterable: Iterable, name: str) -> Iterator:
+        """Yield from ``iterable``, charging the time spent producing each item to ``name``."""
+        it = iter(iterable)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.totals[name] += time.perf_counter() - t0
+                return
+            self.totals[name] += time.perf_counter() - t0
+            yield item
+
+    def summary(self) -> str:
+        return ", ".join(f"{name} {secs:.2f}s" for name, secs in self.totals.items())
+
+
+_DONE = object()
+
+
+def prefetch(iterable: Iterable, depth: int = 4) -> Iterator:
+    """Run ``iterable`` on a background thread, buffering up to ``depth`` items.
+
+    Lets extraction and chunking proceed while the consumer embeds; exceptions
+    from the producer are re-raised in the consumer.
+    """
+    q: "queue.Queue" = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((_DONE, None))
+        except BaseException as e:
+            put((_DONE, e))
+
+    worker = threading.Thread(target=produce, name="ingest-prefetch", daemon=True)
+    worker.start()
+    try:
+        while True:
+            item, error = q.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def iter_batches(iterable: Iterable, size: int) -> Iterator[List]:
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_chunks_simple(pages: Iterable[str], size: int, overlap: int) -> Iterator[Tuple[int, int, str]]:
+    """
+    Streaming chunk_text_simple over '\n'.join(pages), yielding (start, end, text)
+    with offsets into the joined text; only a chunk's worth of text is buffered.
+    """
+    if size <= 0:
+        text = "\n".join(pages)
+        yield 0, len(text), text
+        return
+    buf = None
+    base = 0  # offset of buf[0] in the joined text
+    start = 0
+    for page in pages:
+        buf = page if buf is None else buf + "\n" + page
+        # A chunk reaching the end of the buffer may still grow, so stop short of it
+        while start + size < len(buf):
+            end = start + size
+            yield base + start, base + end, buf[start:end]
+            start = max(end - overlap, start + 1)
+        buf = buf[start:]
+        base += start
+        start = 0
+    if buf is None:
+        return
+    n = len(buf)
+    while start < n:
+        end = min(start + size, n)
+        yield base + start, base + end, buf[start:end]
+        if end == n:
+            break
+        start = max(end - overlap, start + 1)
+
+
+def iter_chunks_sentence_aware(pages: Iterable[str], size: int) -> Iterator[Tuple[int, int, str]]:
+    """
+    Streaming chunk_text_sentence_aware over '\n'.join(pages), yielding
+    (start, end, text). A chunk spans whole sentences and its text is the
+    original slice, so sentences keep their original separators.
+    """
+    buf = ""
+    base = 0          # offset of buf[0] in the joined text
+    region = None     # buf index where unsplit text starts; None until the first non-space
+    cur_start = cur_end = None
+    cur_len = 0
+    first = True
+
+    def take(spans):
+        nonlocal cur_start, cur_end, cur_len
+        done = []
+        for s, e in spans:
+            s_len = e - s
+            if cur_start is None:
+                cur_start, cur_end, cur_len = s, e, s_len + 1
+            elif cur_len + s_len <= size:
+                cur_end = e
+                cur_len += s_len + 1
+            else:
+                done.append((cur_start, cur_end))
+                cur_start, cur_end, cur_len = s, e, s_len + 1
+        return done
+
+    def emit(spans):
+        for s, e in spans:
+            yield s, e, buf[s - base:e - base]
+
+    for page in pages:
+        buf = page if first else buf + "\n" + page
+        first = False
+        if region is None:
+            stripped = len(buf) - len(buf.lstrip())
+            if stripped == len(buf):
+                continue
+            region = stripped
+        # Split only at separators followed by more text: the last sentence may continue
+        matches = [m for m in SENTENCE_SPLIT_RE.finditer(buf, region) if m.end() < len(buf)]
+        if not matches:
+            continue
+        bounds = [region] + [x for m in matches for x in (m.start(), m.end())]
+        spans = [(base + bounds[i], base + bounds[i + 1]) for i in range(0, len(bounds) - 1, 2)]
+        yield from emit(take(spans))
+        region = matches[-1].end()
+        # Keep text from the chunk in progress onwards
+        keep = min(region, cur_start - base) if cur_start is not None else region
+        buf = buf[keep:]
+        base += keep
+        region -= keep
+    if region is not None:
+        end = len(buf.rstrip())
+        matches = list(SENTENCE_SPLIT_RE.finditer(buf, region, end))
+        bounds = [region] + [x for m in matches for x in (m.start(), m.end())] + [end]
+        spans = [(base + bounds[i], base + bounds[i + 1]) for i in range(0, len(bounds) - 1, 2)]
+        yield from emit(take(spans))
+    if cur_start is not None:
+        yield from emit([(cur_start, cur_end)])
@@ -0,0 +1,60 @@
+import os
+import re
+import logging
+import importlib.util
+
+logger = logging.getLogger(__name__)
+
+# torch: PyTorch (reference); onnx: ONNX Runtime export; onnx-int8: dynamically int8-quantized ONNX
+EMBED_BACKEND = os.getenv('EMBED_BACKEND', 'torch').lower()
+# Intra-op threads for the model; 0 keeps the library default (all cores)
+EMBED_THREADS = int(os.getenv('EMBED_THREADS', '0'))
+# ONNX file inside the model repo for onnx-int8; the default is the AVX2 build shipped with MiniLM
+EMBED_ONNX_INT8_FILE = os.getenv('EMBED_ONNX_INT8_FILE', 'onnx/model_quint8_avx2.onnx')
+
+BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+
+def embed_model_id(model_name, backend=EMBED_BACKEND):
+    """Cache key for embeddings: vectors from different backends must not be mixed."""
+    return model_name if backend == 'torch' else f"{model_name}#{backend}"
+
+
+def check_backend(backend=EMBED_BACKEND):
+    """Raise with an install hint if ``backend`` cannot be loaded in this environment."""
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown embedding backend {backend!r}; expected one of {BACKENDS}")
+    if backend == 'torch':
+        return
+    import sentence_transformers
+    version = getattr(sentence_transformers, '__version__', '0')
+    missing = [name for name in ('optimum', 'onnxruntime') if importlib.util.find_spec(name) is None]
+    if tuple(int(p) for p in re.findall(r'\d+', version)[:2]) < (3, 2) or missing:
+        raise RuntimeError(
+            f"EMBED_BACKEND={backend} needs sentence-transformers>=3.2 and optimum[onnxruntime] "
+            f"(found sentence-transformers {version}{', missing ' + ', '.join(missing) if missing else ''}); "
+            f"pip install -r requirements-onnx.txt or set EMBED_BACKEND=torch")
+
+
+def _session_options(threads):
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = threads
+    return options
+
+
+def load_embed_model(model_name, backend=EMBED_BACKEND, threads=EMBED_THREADS):
+    """SentenceTransformer for ``model_name`` running on ``backend``."""
+    from sentence_transformers import SentenceTransformer
+    check_backend(backend)
+    if backend == 'torch':
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        return SentenceTransformer(model_name)
+    model_kwargs = {'provider': 'CPUExecutionProvider'}
+    if threads:
+        model_kwargs['session_options'] = _session_options(threads)
+    if backend == 'onnx-int8':
+        model_kwargs['file_name'] = EMBED_ONNX_INT8_FILE
+    return SentenceTransformer(model_name, backend='onnx', model_kwargs=model_kwargs)
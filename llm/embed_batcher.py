@@ -0,0 +1,138 @@
+import os
+import queue
+import threading
+import time
+import logging
+from collections import defaultdict
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Cross-request batching of encode() calls; EMBED_MICROBATCH=false calls the model directly
+EMBED_MICROBATCH = os.getenv('EMBED_MICROBATCH', 'true').lower() == 'true'
+EMBED_BATCH_MAX_ITEMS = int(os.getenv('EMBED_BATCH_MAX_ITEMS', '64'))
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv('EMBED_BATCH_MAX_WAIT_MS', '5'))
+
+
+class Histogram:
+    """Thread-safe counts per power-of-two bucket (upper bounds 1, 2, 4, ...)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = defaultdict(int)
+        self.count = 0
+        self.total = 0
+
+    def add(self, value: int):
+        bucket = 1 << max(0, int(value) - 1).bit_length()
+        with self._lock:
+            self._buckets[bucket] += 1
+            self.count += 1
+            self.total += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "count": self.count,
+                "mean": self.total / self.count if self.count else 0.0,
+                "buckets": {f"<={b}": n for b, n in sorted(self._buckets.items())},
+            }
+
+
+class EmbeddingBatcher:
+    """Coalesces encode calls from concurrent requests into one model call.
+
+    A worker thread takes the oldest request, then keeps collecting queued ones
+    for up to ``max_wait_ms`` or until ``max_items`` texts are gathered, runs a
+    single ``encode`` and hands each caller its slice of the result. A request
+    larger than ``max_items`` runs as a batch of its own.
+    """
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray],
+                 max_items: int = EMBED_BATCH_MAX_ITEMS, max_wait_ms: float = EMBED_BATCH_MAX_WAIT_MS):
+        self._encode = encode
+        self.max_items = max(1, max_items)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue: "queue.Queue[Tuple[List[str], Future]]" = queue.Queue()
+        self._carry: Optional[Tuple[List[str], Future]] = None
+        self._start_lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._pid = None
+        self.batches = 0
+        self.queue_depth = Histogram()
+        self.batch_size = Histogram()
+
+    def submit(self, texts: List[str]) -> Future:
+        future: Future = Future()
+        self._ensure_worker()
+        self._queue.put((list(texts), future))
+        return future
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.submit(texts).result()
+
+    def start(self):
+        """Start this process's worker thread now; it inherits the calling thread's nice value."""
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        # A forked child inherits the attributes but not the thread: start its own
+        if self._worker is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._worker is None or self._pid != os.getpid():
+                if self._pid is not None:
+                    self._queue = queue.Queue()
+                    self._carry = None
+                self._pid = os.getpid()
+                self._worker = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                self._worker.start()
+
+    def _collect(self) -> List[Tuple[List[str], Future]]:
+        first, self._carry = self._carry or self._queue.get(), None
+        # Requests waiting when the batch opens, including the one that opens it
+        self.queue_depth.add(self._queue.qsize() + 1)
+        batch, n_items = [first], len(first[0])
+        deadline = time.monotonic() + self.max_wait
+        while n_items < self.max_items:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if n_items + len(item[0]) > self.max_items:
+                self._carry = item
+                break
+            batch.append(item)
+            n_items += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [t for item, _ in batch for t in item]
+            self.batches += 1
+            self.batch_size.add(len(texts))
+            try:
+                embs = self._encode(texts)
+            except BaseException as e:
+                logger.exception("Batched encode of %d texts failed", len(texts))
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            pos = 0
+            for item, future in batch:
+                future.set_result(embs[pos:pos + len(item)])
+                pos += len(item)
+
+    def stats(self) -> dict:
+        return {
+            "max_items": self.max_items,
+            "max_wait_ms": self.max_wait * 1000,
+            "pending": self._queue.qsize(),
+            "batches": self.batches,
+            "queue_depth": self.queue_depth.snapshot(),
+            "batch_size": self.batch_size.snapshot(),
+        }
@@ -0,0 +1,95 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import logging
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# SQLite file shared by every process on the host; empty disables the cache
+EMBEDDING_DB_PATH = os.getenv(
+    'EMBEDDING_DB_PATH', os.path.join(os.getenv('INDEX_CACHE_DIR', '.index_cache'), 'embeddings.sqlite3'))
+
+# Keys per SELECT ... IN (...); stays under SQLite's bound-parameter limit
+_LOOKUP_CHUNK = 500
+
+
+class EmbeddingCache:
+    """Persistent text -> embedding cache in one SQLite table, meant for document chunks.
+
+    Keys are the SHA-256 of the model name and the text, so vectors from another
+    model are never returned. Database errors are logged and treated as misses.
+    """
+
+    def __init__(self, path: str, model_name: str):
+        self.path = path
+        self.model_name = model_name
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = None
+        self._pid = None
+        self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        """The connection for this process; a forked worker opens its own instead of sharing the parent's."""
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._pid = os.getpid()
+            # WAL lets worker processes read while another one writes
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)')
+            self._conn.commit()
+        return self._conn
+
+    def key(self, text: str) -> bytes:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode('utf-8', 'surrogatepass')).digest()
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Cached vectors in input order, None for misses."""
+        keys = [self.key(t) for t in texts]
+        found = {}
+        try:
+            with self._lock:
+                for i in range(0, len(keys), _LOOKUP_CHUNK):
+                    chunk = keys[i:i + _LOOKUP_CHUNK]
+                    rows = self._connect().execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+                    found.update(rows.fetchall())
+        except sqlite3.Error as e:
+            logger.warning(f"Embedding cache lookup failed: {e}")
+        vectors = [np.frombuffer(found[k], dtype='float32') if k in found else None for k in keys]
+        hits = sum(v is not None for v in vectors)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(vectors) - hits
+        return vectors
+
+    def put_many(self, texts: Sequence[str], vectors: np.ndarray):
+        rows = [(self.key(t), np.asarray(v, dtype='float32').tobytes()) for t, v in zip(texts, vectors)]
+        try:
+            with self._lock, self._connect() as conn:
+                conn.executemany('INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)', rows)
+        except sqlite3.Error as e:
+            logger.warning(f"Embedding cache write failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"path": self.path, "hits": self.hits, "misses": self.misses}
+
+
+def open_embedding_cache(model_name: str, path: str = EMBEDDING_DB_PATH) -> Optional[EmbeddingCache]:
+    if not path:
+        return None
+    try:
+        return EmbeddingCache(path, model_name)
+    except (OSError, sqlite3.Error) as e:
+        logger.warning(f"Embedding cache at {path} unavailable: {e}")
+        return None
@@ -1,24 +1,169 @@
-import google.generativeai as genai
 import os
+import copy
+import json
+import re
 import numpy as np
 from dotenv import load_dotenv
 import time
 import logging
-from sentence_transformers import SentenceTransformer
+import threading
+
+from llm.embedding_cache import open_embedding_cache
+from llm.embed_batcher import EMBED_MICROBATCH, EmbeddingBatcher
+from llm.embed_backends import EMBED_BACKEND, embed_model_id, load_embed_model
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-genai.configure(api_key=GEMINI_API_KEY)
 
-# Load embedding model once
-_EMBED_MODEL = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+EMBED_MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+# Model name plus backend (EMBED_BACKEND); keys persisted embeddings and indexes
+EMBED_MODEL_ID = embed_model_id(EMBED_MODEL_NAME)
+# Texts per forward pass are capped by EMBED_ENCODE_BATCH_SIZE and by a padded-token budget:
+# a batch of n texts whose longest is L tokens costs about n * L
+EMBED_ENCODE_BATCH_SIZE = int(os.getenv('EMBED_ENCODE_BATCH_SIZE', '128'))
+EMBED_TOKEN_BUDGET = int(os.getenv('EMBED_TOKEN_BUDGET', '4096'))
+
+# Model and Gemini client are created on first use, so importing this module stays cheap
+_EMBED_MODEL = None
+_EMBED_MODEL_LOCK = threading.Lock()
+_GENAI = None
+_GENAI_LOCK = threading.Lock()
+# token_lengths() tokenizes with its own copy of the model's tokenizer (see there)
+_LENGTH_TOKENIZER = None
+_LENGTH_TOKENIZER_LOCK = threading.Lock()
+# Persistent text -> vector cache consulted before the model (EMBEDDING_DB_PATH)
+EMBEDDING_CACHE = open_embedding_cache(EMBED_MODEL_ID)
+
+
+def get_embed_model():
+    """The SentenceTransformer on EMBED_BACKEND, loaded once on first call; safe to call from any thread."""
+    global _EMBED_MODEL
+    if _EMBED_MODEL is None:
+        with _EMBED_MODEL_LOCK:
+            if _EMBED_MODEL is None:
+                start_time = time.time()
+                _EMBED_MODEL = load_embed_model(EMBED_MODEL_NAME)
+                logger.info(f"Loaded embedding model {EMBED_MODEL_NAME} ({EMBED_BACKEND}) "
+                            f"in {time.time() - start_time:.2f}s")
+    return _EMBED_MODEL
+
+
+def get_genai():
+    """The google.generativeai module, configured with GEMINI_API_KEY on first call."""
+    global _GENAI
+    if _GENAI is None:
+        with _GENAI_LOCK:
+            if _GENAI is None:
+                import google.generativeai as genai
+                genai.configure(api_key=GEMINI_API_KEY)
+                _GENAI = genai
+    return _GENAI
+
+
+def token_lengths(texts):
+    """
+    Token count per text as the model will see it (truncated to max_seq_length).
+    Counting uses a private copy of the tokenizer, one thread at a time: encode()
+    turns padding on in the model's own tokenizer, and an HF fast tokenizer whose
+    settings change while another thread uses it raises "Already borrowed".
+    """
+    global _LENGTH_TOKENIZER
+    model = get_embed_model()
+    tokenizer = getattr(model, 'tokenizer', None)
+    if tokenizer is None:
+        return [len(t) // 4 + 2 for t in texts]
+    max_len = getattr(model, 'max_seq_length', None) or 512
+    with _LENGTH_TOKENIZER_LOCK:
+        if _LENGTH_TOKENIZER is None:
+            _LENGTH_TOKENIZER = copy.deepcopy(tokenizer)
+        encoded = _LENGTH_TOKENIZER(list(texts), truncation=True, max_length=max_len)
+    return [len(ids) for ids in encoded['input_ids']]
+
+
+def token_budget_batches(lengths, budget=EMBED_TOKEN_BUDGET, max_items=EMBED_ENCODE_BATCH_SIZE):
+    """
+    Group text indices sorted by length into batches whose padded size
+    (count * longest) stays within ``budget``: many short texts per batch,
+    few long ones, and little padding in either.
+    """
+    batches, current, longest = [], [], 0
+    for i in sorted(range(len(lengths)), key=lengths.__getitem__):
+        longest = max(longest, lengths[i])
+        if current and (len(current) >= max_items or (len(current) + 1) * longest > budget):
+            batches.append(current)
+            current, longest = [], lengths[i]
+        current.append(i)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _encode_now(texts):
+    """Encode in length-bucketed, token-budgeted batches; rows come back in input order."""
+    model = get_embed_model()
+    if not texts:
+        return np.empty((0, model.get_sentence_embedding_dimension()), dtype='float32')
+    out = None
+    for idx in token_budget_batches(token_lengths(texts)):
+        embs = model.encode([texts[i] for i in idx], normalize_embeddings=True,
+                            batch_size=len(idx), show_progress_bar=False)
+        if out is None:
+            out = np.empty((len(texts), np.shape(embs)[1]), dtype='float32')
+        out[idx] = embs
+    return out
+
+
+# Concurrent requests share encode() calls instead of each paying the per-call overhead
+EMBED_BATCHER = EmbeddingBatcher(_encode_now) if EMBED_MICROBATCH else None
+
+
+def warmup_embeddings():
+    """Load the model and run one real encode, bypassing caches and the batcher; returns the vectors."""
+    return _encode_now(["What is the grace period for premium payment?",
+                        "Pre-existing diseases are covered after a waiting period of 36 months."])
+
+
+def _encode(texts, microbatch=True):
+    if EMBED_BATCHER is None or not microbatch or not texts:
+        return _encode_now(texts)
+    return EMBED_BATCHER.encode(texts)
+
+
+_JSON_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def _parse_batch_answers(raw, n):
+    """Parse the model's JSON into ``n`` answers; unusable entries come back as None."""
+    answers = [None] * n
+    try:
+        data = json.loads(_JSON_FENCE_RE.sub("", raw.strip()))
+    except (TypeError, ValueError):
+        logger.warning("Batch answer was not valid JSON")
+        return answers
+    if isinstance(data, dict):
+        data = data.get("answers", [])
+    if not isinstance(data, list):
+        return answers
+    for pos, item in enumerate(data):
+        if isinstance(item, dict):
+            idx, text = item.get("id", pos + 1), item.get("answer")
+        else:
+            idx, text = pos + 1, item
+        try:
+            idx = int(idx) - 1
+        except (TypeError, ValueError):
+            continue
+        if 0 <= idx < n and isinstance(text, str) and text.strip():
+            answers[idx] = text.strip()
+    return answers
+
 
 class GeminiLLM:
     def __init__(self, model_name='gemini-1.5-flash'):
-        self.model = genai.GenerativeModel(model_name)
+        self.model = get_genai().GenerativeModel(model_name)
 
     def extract_entities(self, query):
         prompt = f"""
@@ -33,14 +178,30 @@ Return as JSON.
             logger.error(f"Entity extraction error: {e}")
             return "{}"
 
-    def get_embeddings(self, texts):
-        """Batch embeddings for speed."""
-        embs = _EMBED_MODEL.encode(texts, normalize_embeddings=True, batch_size=8, show_progress_bar=False)
-        return np.asarray(embs, dtype='float32')
+    def get_embeddings(self, texts, persist=True, microbatch=True):
+        """
+        Batch embeddings for speed; only texts missing from EMBEDDING_CACHE reach the model.
+        persist=False skips the persistent cache, for one-off texts such as user questions
+        that would only grow the database. microbatch=False encodes on the calling thread
+        instead of EMBED_BATCHER's, e.g. so background work runs at its thread's priority.
+        """
+        texts = list(texts)
+        if EMBEDDING_CACHE is None or not persist:
+            return _encode(texts, microbatch)
+        vectors = EMBEDDING_CACHE.get_many(texts)
+        missing = list(dict.fromkeys(t for t, vec in zip(texts, vectors) if vec is None))
+        if missing:
+            fresh = _encode(missing, microbatch)
+            EMBEDDING_CACHE.put_many(missing, fresh)
+            by_text = dict(zip(missing, fresh))
+            vectors = [by_text[t] if vec is None else vec for t, vec in zip(texts, vectors)]
+        if not vectors:
+            return _encode(texts, microbatch)
+        return np.vstack(vectors).astype('float32')
 
     def get_embedding(self, text):
-        # Route through batch path for consistency
-        return self.get_embeddings([text])[0]
+        # Route through batch path for consistency; single texts are queries, not chunks
+        return self.get_embeddings([text], persist=False)[0]
 
     def answer_query(self, query, retrieved_chunks):
         """
@@ -65,3 +226,31 @@ Provide a concise answer (max 100 words):
         except Exception as e:
             logger.error(f"LLM generation error: {e}")
             return "Unable to generate an answer right now. Please try again with a more specific question."
+
+    def answer_queries(self, queries, clauses):
+        """
+        Answer several questions with a single generate_content call.
+        Returns one answer per query, None where no usable answer was parsed.
+        """
+        clause_block = "\n\n".join(f"[{i}] {c}" for i, c in enumerate(clauses, 1))
+        question_block = "\n".join(f"{i}. {q}" for i, q in enumerate(queries, 1))
+        prompt = f"""
+You are an insurance policy assistant. Answer each question in 1-2 sentences (max 80 words) using ONLY the clauses below. Be precise and natural; don't include citations.
+
+Clauses:
+{clause_block}
+
+Questions:
+{question_block}
+
+Return JSON only, in the form {{"answers": [{{"id": <question number>, "answer": "<answer>"}}]}}, with one entry per question.
+"""
+        try:
+            start_time = time.time()
+            response = self.model.generate_content(prompt, generation_config={"response_mime_type": "application/json"})
+            logger.info(f"Batch LLM response for {len(queries)} questions generated in {time.time() - start_time:.2f}s")
+            raw = response.text or ""
+        except Exception as e:
+            logger.error(f"Batch LLM generation error: {e}")
+            return [None] * len(queries)
+        return _parse_batch_answers(raw, len(queries))
@@ -0,0 +1,65 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+from ingest.pdf_engines import extract_pdf_pages, pdf_page_count
+from ingest.pipeline import iter_chunks_simple
+from llm.embed_backends import BACKENDS, EMBED_THREADS, load_embed_model
+from llm.gemini_api import EMBED_MODEL_NAME
+
+# Embedding parity and speed of each backend against the PyTorch reference on
+# the chunks of the bundled policy wording. Exits non-zero if any chunk's
+# cosine similarity to its reference embedding falls below the tolerance.
+PDF_PATH = sys.argv[1] if len(sys.argv) > 1 else os.path.join("docs", "ICIHLIP22012V012223.pdf")
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "800"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+TOLERANCE = float(os.getenv("PARITY_MIN_COSINE", "0.98"))
+CANDIDATES = os.getenv("PARITY_BACKENDS", ",".join(b for b in BACKENDS if b != "torch")).split(",")
+
+
+def embed(model, chunks):
+    model.encode(chunks[:8], show_progress_bar=False)  # warm up
+    t0 = time.perf_counter()
+    embs = model.encode(chunks, normalize_embeddings=True, batch_size=32, show_progress_bar=False)
+    return np.asarray(embs, dtype="float32"), time.perf_counter() - t0
+
+
+with open(PDF_PATH, "rb") as f:
+    data = f.read()
+pages = [text for text, _ in extract_pdf_pages(data, 0, pdf_page_count(data))]
+chunks = [t for _, _, t in iter_chunks_simple(pages, CHUNK_SIZE, CHUNK_OVERLAP) if t.strip()]
+
+print("=== Embedding Backend Parity ===")
+print(f"File: {PDF_PATH}; {len(chunks)} chunks; {EMBED_MODEL_NAME}; threads {EMBED_THREADS or 'default'}")
+print("=" * 72)
+print(f"{'backend':<12}{'seconds':>10}{'chunks/s':>10}{'min cos':>10}{'mean cos':>10}{'top1 agree':>12}")
+
+reference, ref_secs = embed(load_embed_model(EMBED_MODEL_NAME, "torch"), chunks)
+print(f"{'torch':<12}{ref_secs:>10.2f}{len(chunks) / ref_secs:>10.1f}{1:>10.4f}{1:>10.4f}{1:>12.3f}")
+
+failed = []
+for backend in CANDIDATES:
+    try:
+        model = load_embed_model(EMBED_MODEL_NAME, backend)
+    except Exception as e:
+        print(f"{backend:<12} unavailable: {e}")
+        failed.append(backend)
+        continue
+    embs, secs = embed(model, chunks)
+    cos = np.sum(embs * reference, axis=1)
+    # Does each chunk's nearest other chunk stay the same? A retrieval-level check
+    ref_sims, sims = reference @ reference.T, embs @ embs.T
+    np.fill_diagonal(ref_sims, -1)
+    np.fill_diagonal(sims, -1)
+    agree = np.mean(ref_sims.argmax(axis=1) == sims.argmax(axis=1))
+    print(f"{backend:<12}{secs:>10.2f}{len(chunks) / secs:>10.1f}{cos.min():>10.4f}{cos.mean():>10.4f}{agree:>12.3f}")
+    if cos.min() < TOLERANCE:
+        failed.append(backend)
+
+print("=" * 72)
+if failed:
+    print(f"FAIL: {', '.join(failed)} below min cosine {TOLERANCE} or unavailable")
+    sys.exit(1)
+print(f"OK: every backend within min cosine {TOLERANCE}")
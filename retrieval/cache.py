@@ -0,0 +1,146 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+_MISSING = object()
+
+
+def estimate_nbytes(value: Any) -> int:
+    """Rough resident size of a cached value: array/index bytes plus text bytes."""
+    if value is None:
+        return 0
+    nbytes = getattr(value, "nbytes", None)
+    if callable(nbytes):
+        return int(nbytes())
+    if nbytes is not None:
+        return int(nbytes)
+    if isinstance(value, str):
+        return len(value.encode("utf-8", "ignore"))
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(estimate_nbytes(k) + estimate_nbytes(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sum(estimate_nbytes(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class BoundedCache:
+    """Thread-safe LRU cache bounded by total bytes and/or entry count, with optional TTL.
+
+    ``max_bytes``, ``max_items`` and ``ttl`` of 0 mean "no limit". Entries larger
+    than ``max_bytes`` on their own are not stored.
+    """
+
+    def __init__(self, name: str, max_bytes: int = 0, max_items: int = 0, ttl: float = 0,
+                 sizeof: Callable[[Any], int] = estimate_nbytes):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.ttl = ttl
+        self._sizeof = sizeof
+        self._lock = threading.Lock()
+        # key -> (value, nbytes, expires_at)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @classmethod
+    def from_env(cls, prefix: str, max_bytes: int = 0, max_items: int = 0, ttl: float = 0, **kwargs) -> "BoundedCache":
+        """Build a cache whose limits can be overridden by ``<PREFIX>_MAX_BYTES``, ``_MAX_ITEMS`` and ``_TTL``."""
+        return cls(
+            prefix.lower(),
+            max_bytes=int(os.getenv(f"{prefix}_MAX_BYTES", str(max_bytes))),
+            max_items=int(os.getenv(f"{prefix}_MAX_ITEMS", str(max_items))),
+            ttl=float(os.getenv(f"{prefix}_TTL", str(ttl))),
+            **kwargs,
+        )
+
+    def _drop(self, key):
+        _, nbytes, _ = self._data.pop(key)
+        self._bytes -= nbytes
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, _, expires_at = entry
+            if expires_at and expires_at <= time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        nbytes = self._sizeof(value) + estimate_nbytes(key)
+        expires_at = time.monotonic() + self.ttl if self.ttl > 0 else 0
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            if self.max_bytes and nbytes > self.max_bytes:
+                return
+            self._data[key] = (value, nbytes, expires_at)
+            self._bytes += nbytes
+            while self._data and ((self.max_bytes and self._bytes > self.max_bytes)
+                                  or (self.max_items and len(self._data) > self.max_items)):
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data[key][0]
+            self._drop(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            return entry is not _MISSING and not (entry[2] and entry[2] <= time.monotonic())
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_items": self.max_items,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import logging
+from typing import Optional
+
+from retrieval.vector_store import SimpleVectorStore
+
+logger = logging.getLogger(__name__)
+
+INDEX_CACHE_DIR = os.getenv("INDEX_CACHE_DIR", ".index_cache")
+# Memory-map cached indexes so every worker process shares one page-cached copy
+INDEX_CACHE_MMAP = os.getenv("INDEX_CACHE_MMAP", "true").lower() == "true"
+# Seconds a URL -> content hash entry is trusted without contacting the server; older
+# entries are revalidated with a conditional GET. 0 revalidates on every request
+URL_REVALIDATE_SECONDS = float(os.getenv("URL_REVALIDATE_SECONDS", "300"))
+# Entries kept in urls.sqlite3; expired ones and the least recently checked beyond this are pruned
+URL_TABLE_MAX_ENTRIES = int(os.getenv("URL_TABLE_MAX_ENTRIES", "10000"))
+
+# remember_url() calls between prunes of the URL table
+_URL_PRUNE_EVERY = 256
+
+
+def hash_bytes(data) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class IndexDiskCache:
+    """Content-addressed on-disk cache of built vector stores.
+
+    Layout under ``root``:
+        urls.sqlite3         document URL -> sha256 of the document bytes and when it was last checked
+        <sha256>/            SimpleVectorStore.save() output (index, texts, store.json)
+        <sha256>/meta.json   build settings the index was produced with
+    """
+
+    def __init__(self, root: str = INDEX_CACHE_DIR, mmap: bool = INDEX_CACHE_MMAP,
+                 url_ttl: float = URL_REVALIDATE_SECONDS, max_urls: int = URL_TABLE_MAX_ENTRIES):
+        self.root = root
+        self.mmap = mmap
+        self.url_ttl = url_ttl
+        self.max_urls = max_urls
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._writes = 0
+        os.makedirs(self.root, exist_ok=True)
+        try:
+            self._connect()
+        except sqlite3.Error as e:
+            logger.warning(f"URL table in {self.root} unavailable: {e}")
+
+    def _entry_dir(self, doc_hash: str) -> str:
+        return os.path.join(self.root, doc_hash)
+
+    def _connect(self) -> sqlite3.Connection:
+        """The URL table connection for this process; a forked worker opens its own."""
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(os.path.join(self.root, "urls.sqlite3"), check_same_thread=False, timeout=30)
+            self._pid = os.getpid()
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, doc_hash TEXT NOT NULL, checked REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS urls_checked ON urls (checked)")
+            self._conn.commit()
+        return self._conn
+
+    def lookup_url(self, url: str) -> Optional[str]:
+        """Content hash of ``url`` if it was checked within ``url_ttl`` seconds, else None."""
+        if self.url_ttl <= 0:
+            return None
+        try:
+            with self._lock:
+                row = self._connect().execute("SELECT doc_hash FROM urls WHERE url = ? AND checked >= ?",
+                                              (url, time.time() - self.url_ttl)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"URL table lookup failed: {e}")
+            return None
+        return row[0] if row else None
+
+    def remember_url(self, url: str, doc_hash: str):
+        """Record that ``url`` served ``doc_hash`` just now; every so often drop expired and excess entries."""
+        if self.url_ttl <= 0:
+            return
+        now = time.time()
+        try:
+            with self._lock, self._connect() as conn:
+                conn.execute("INSERT OR REPLACE INTO urls (url, doc_hash, checked) VALUES (?, ?, ?)", (url, doc_hash, now))
+                self._writes += 1
+                if self._writes % _URL_PRUNE_EVERY == 0:
+                    conn.execute("DELETE FROM urls WHERE checked < ?", (now - self.url_ttl,))
+                    if self.max_urls > 0:
+                        conn.execute("DELETE FROM urls WHERE checked < (SELECT checked FROM urls ORDER BY checked DESC "
+                                     "LIMIT 1 OFFSET ?)", (self.max_urls - 1,))
+        except sqlite3.Error as e:
+            logger.warning(f"URL table write failed: {e}")
+
+    def load(self, doc_hash: str, settings: Optional[dict] = None) -> Optional[SimpleVectorStore]:
+        entry = self._entry_dir(doc_hash)
+        try:
+            with open(os.path.join(entry, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if settings is not None and meta.get("settings") != settings:
+                logger.info("Index cache entry %s was built with other settings; rebuilding", doc_hash[:12])
+                return None
+            return SimpleVectorStore.load(entry, mmap=self.mmap)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logger.exception("Failed to load index cache entry %s", doc_hash[:12])
+            return None
+
+    def save(self, doc_hash: str, store: SimpleVectorStore, settings: Optional[dict] = None):
+        tmp_dir = tempfile.mkdtemp(dir=self.root, prefix=".tmp-")
+        try:
+            store.save(tmp_dir)
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"doc_hash": doc_hash, "dim": store.index.d, "ntotal": store.index.ntotal, "settings": settings}, f)
+            entry = self._entry_dir(doc_hash)
+            shutil.rmtree(entry, ignore_errors=True)
+            os.replace(tmp_dir, entry)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            logger.exception("Failed to write index cache entry %s", doc_hash[:12])
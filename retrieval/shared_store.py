@@ -0,0 +1,312 @@
+import hashlib
+import threading
+import logging
+from array import array
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+
+from retrieval.vector_store import ChunkTexts, text_spans
+
+logger = logging.getLogger(__name__)
+
+# Rough per-row cost of the chunk-key dict entry (16-byte digest object + slot)
+_KEY_OVERHEAD = 100
+
+
+def chunk_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+def _vectors(index, ids) -> np.ndarray:
+    if isinstance(index, faiss.IndexIVF) and not index.direct_map.type:
+        index.make_direct_map()
+    return index.reconstruct_batch(np.asarray(ids, dtype="int64"))
+
+
+class _ReadWriteLock:
+    """Any number of readers or one writer; a waiting writer holds back new readers."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class SharedVectorStore:
+    """One inner-product index over the unique chunks of many documents.
+
+    A document is an array of row ids. A chunk whose text is already indexed
+    for another document reuses that row, so vectors and text are stored (and
+    embedded) once however many policies repeat the same boilerplate. A search
+    restricted to a set of documents is an exact scan of their rows only, so
+    its cost follows the document size rather than the corpus, and the index
+    stays flat. Once ``max_bytes`` is exceeded the least recently used
+    documents are dropped and rows no document references are compacted.
+
+    Searches run concurrently under a shared lock. Writers (add_store and
+    eviction) are serialized among themselves, hash chunks and rebuild the
+    compacted index without blocking searches, and hold the exclusive lock only
+    to append vectors or swap in the rebuilt structures.
+    """
+
+    def __init__(self, max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self._rw = _ReadWriteLock()
+        self._write_lock = threading.Lock()
+        self.index: Optional[faiss.Index] = None
+        self.texts = ChunkTexts()
+        self._rows: Dict[bytes, int] = {}
+        self._refcounts = array("i")
+        # doc key -> int64 row ids, least recently used first
+        self._documents: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._dead = 0
+        self.evictions = 0
+        self.compactions = 0
+
+    def __contains__(self, doc_key: str) -> bool:
+        with self._rw.read():
+            return doc_key in self._documents
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def touch(self, doc_key: str) -> bool:
+        """Mark ``doc_key`` as recently used; False if it is not loaded."""
+        with self._rw.read():
+            if doc_key not in self._documents:
+                return False
+            # Readers may reorder concurrently: move_to_end is atomic under the GIL,
+            # and only writers, holding the exclusive lock, read the order
+            self._documents.move_to_end(doc_key)
+            return True
+
+    def lookup_embeddings(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Stored vectors for texts that are already indexed, None for the rest."""
+        keys = [chunk_key(t) for t in texts]
+        with self._rw.read():
+            rows = [self._rows.get(k) for k in keys]
+            found = [r for r in rows if r is not None]
+            if not found:
+                return [None] * len(texts)
+            vectors = iter(_vectors(self.index, found))
+        return [next(vectors) if r is not None else None for r in rows]
+
+    def add_store(self, doc_key: str, store):
+        """Register ``doc_key`` with the rows of a per-document SimpleVectorStore.
+
+        Only chunks whose text is not indexed yet are copied in; their text is
+        kept as the merged ranges of the source document they cover.
+        """
+        documents, doc_ids, starts, ends = text_spans(store.texts)
+        keys = [chunk_key(documents[d][s:e]) for d, s, e in zip(doc_ids, starts, ends)]
+        with self._write_lock:
+            if self.touch(doc_key):
+                return
+            # Only writers change _rows and the index, so they are read here without _rw
+            base = self.index.ntotal if self.index is not None else 0
+            rows: List[int] = []
+            new_rows: List[int] = []          # source row of each new shared row
+            pending: Dict[bytes, int] = {}
+            for i, key in enumerate(keys):
+                row = self._rows.get(key)
+                if row is None:
+                    row = pending.get(key)
+                if row is None:
+                    row = pending[key] = base + len(new_rows)
+                    new_rows.append(i)
+                rows.append(row)
+            vectors = None
+            if new_rows:
+                vectors = np.ascontiguousarray(_vectors(store.index, new_rows), dtype="float32")
+                # Appending texts is safe under searches: they only read rows the index already has
+                self._add_texts(documents, [doc_ids[i] for i in new_rows],
+                                [starts[i] for i in new_rows], [ends[i] for i in new_rows])
+            doc_rows = np.fromiter(dict.fromkeys(rows), dtype=np.int64)
+            with self._rw.write():
+                if self.index is None:
+                    self.index = faiss.IndexFlatIP(store.index.d)
+                if vectors is not None:
+                    self.index.add(vectors)
+                    self._rows.update(pending)
+                    self._refcounts.extend([0] * len(new_rows))
+                refcounts = np.frombuffer(self._refcounts, dtype=np.int32)
+                refcounts[doc_rows] += 1
+                del refcounts
+                self._documents[doc_key] = doc_rows
+            logger.info(f"Shared index: {doc_key[:12]} has {len(doc_rows)} chunks, {len(new_rows)} new")
+            self._evict(keep=doc_key)
+
+    def _add_texts(self, documents, doc_ids, starts, ends):
+        """Append spans in row order, storing each run of overlapping spans as one piece of text."""
+        pieces = [0] * len(doc_ids)
+        local_starts = [0] * len(doc_ids)
+        local_ends = [0] * len(doc_ids)
+        by_doc = defaultdict(list)
+        for j, d in enumerate(doc_ids):
+            by_doc[d].append(j)
+        for d, members in by_doc.items():
+            members.sort(key=lambda j: starts[j])
+            group: List[int] = []
+            group_end = None
+            for j in members + [None]:
+                if j is None or (group and starts[j] > group_end):
+                    lo = starts[group[0]]
+                    piece = self.texts.add_document(documents[d][lo:group_end])
+                    for k in group:
+                        pieces[k], local_starts[k], local_ends[k] = piece, starts[k] - lo, ends[k] - lo
+                    group, group_end = [], None
+                if j is not None:
+                    group.append(j)
+                    group_end = ends[j] if group_end is None else max(group_end, ends[j])
+        self.texts.add_spans(pieces, local_starts, local_ends)
+
+    def search_above(self, embeddings, top_k: int, min_similarity: float, documents=None):
+        """Like SimpleVectorStore.search_above, restricted to the rows of ``documents`` (all if None)."""
+        queries = np.ascontiguousarray(embeddings, dtype="float32")
+        n_queries = 1 if queries.ndim == 1 else queries.shape[0]
+        with self._rw.read():
+            if self.index is None:
+                return [[] for _ in range(n_queries)]
+            queries = queries.reshape(-1, self.index.d)
+            if documents is None:
+                D, I = self.index.search(queries, top_k)
+            else:
+                rows = []
+                for doc_key in documents:
+                    doc_rows = self._documents.get(doc_key)
+                    if doc_rows is not None:
+                        self._documents.move_to_end(doc_key)
+                        rows.append(doc_rows)
+                if not rows:
+                    return [[] for _ in range(n_queries)]
+                ids = rows[0] if len(rows) == 1 else np.unique(np.concatenate(rows))
+                D, I = self._search_rows(queries, ids, top_k)
+            keep = (I >= 0) & (D >= min_similarity)
+            return [[(self.texts[i], float(sim)) for i, sim in zip(I[row][keep[row]], D[row][keep[row]])]
+                    for row in range(I.shape[0])]
+
+    def _search_rows(self, queries: np.ndarray, ids: np.ndarray, top_k: int):
+        """Exact top-k inner products against the rows ``ids`` only, best first; caller holds the read lock."""
+        n, dim = self.index.ntotal, self.index.d
+        vectors = faiss.rev_swig_ptr(self.index.get_xb(), n * dim).reshape(n, dim)[ids]
+        sims = queries @ vectors.T
+        k = min(top_k, len(ids))
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        top_sims = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_sims, axis=1)
+        return np.take_along_axis(top_sims, order, axis=1), ids[np.take_along_axis(top, order, axis=1)]
+
+    def nbytes(self) -> int:
+        """Approximate resident size: vectors, chunk text, chunk keys and document row lists."""
+        with self._rw.read():
+            return self._nbytes()
+
+    def _nbytes(self) -> int:
+        n = self.index.ntotal if self.index is not None else 0
+        dim = self.index.d if self.index is not None else 0
+        return (n * (dim * 4 + 4) + self.texts.nbytes + len(self._rows) * _KEY_OVERHEAD
+                + sum(rows.nbytes for rows in list(self._documents.values())))
+
+    def _evict(self, keep: str):
+        """Drop least recently used documents past ``max_bytes``; caller holds _write_lock."""
+        if not self.max_bytes or self._nbytes() <= self.max_bytes:
+            return
+        # Estimate the size after compaction so several documents go in one pass
+        per_row = self._nbytes() / max(1, self.index.ntotal)
+        live = self.index.ntotal - self._dead
+        with self._rw.write():
+            refcounts = np.frombuffer(self._refcounts, dtype=np.int32)
+            while live * per_row > self.max_bytes and len(self._documents) > 1:
+                doc_key = next(iter(self._documents))
+                if doc_key == keep:
+                    self._documents.move_to_end(doc_key)
+                    continue
+                rows = self._documents.pop(doc_key)
+                refcounts[rows] -= 1
+                freed = int(np.count_nonzero(refcounts[rows] == 0))
+                self._dead += freed
+                live -= freed
+                self.evictions += 1
+            del refcounts
+        if self._dead:
+            self._compact()
+
+    def _compact(self):
+        """Rebuild the index, texts and row ids without rows no document references.
+
+        The new structures are built while searches continue on the old ones and
+        swapped in under the exclusive lock; caller holds _write_lock.
+        """
+        refcounts = np.frombuffer(self._refcounts, dtype=np.int32)
+        live = np.flatnonzero(refcounts > 0)
+        new_ids = np.full(len(refcounts), -1, dtype=np.int64)
+        new_ids[live] = np.arange(len(live))
+        index = faiss.IndexFlatIP(self.index.d)
+        if len(live):
+            index.add(_vectors(self.index, live))
+        texts = ChunkTexts()
+        pieces: Dict[int, int] = {}
+        old = self.texts
+        doc_ids = []
+        for r in live.tolist():
+            piece = pieces.get(old.doc_ids[r])
+            if piece is None:
+                piece = pieces[old.doc_ids[r]] = texts.add_document(old.documents[old.doc_ids[r]])
+            doc_ids.append(piece)
+        texts.add_spans(doc_ids, [old.starts[r] for r in live.tolist()], [old.ends[r] for r in live.tolist()])
+        row_map = {key: int(new_ids[r]) for key, r in self._rows.items() if refcounts[r] > 0}
+        live_refcounts = array("i", refcounts[live].tolist())
+        del refcounts
+        with self._rw.write():
+            self._documents = OrderedDict((doc_key, new_ids[rows]) for doc_key, rows in self._documents.items())
+            self.index, self.texts, self._rows, self._refcounts = index, texts, row_map, live_refcounts
+            self._dead = 0
+        self.compactions += 1
+
+    def stats(self) -> dict:
+        with self._rw.read():
+            unique = (self.index.ntotal if self.index is not None else 0) - self._dead
+            return {
+                "name": "shared_index",
+                "documents": len(self._documents),
+                "chunks": int(sum(len(rows) for rows in list(self._documents.values()))),
+                "unique_chunks": unique,
+                "bytes": self._nbytes(),
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "compactions": self.compactions,
+            }
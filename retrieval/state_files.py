@@ -0,0 +1,71 @@
+import json
+import os
+import tempfile
+import logging
+from contextlib import contextmanager
+from typing import Callable
+
+try:
+    import fcntl
+except ImportError:  # no cross-process locking outside POSIX
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def file_lock(path: str, blocking: bool = True):
+    """Exclusive flock on ``path`` (created if missing), held for the block.
+
+    Yields True once the lock is held, or False right away when ``blocking`` is
+    off and another process holds it. Without fcntl it always yields True.
+    """
+    if fcntl is None:
+        yield True
+        return
+    with open(path, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def read_json(path: str) -> dict:
+    """The JSON object in ``path``; {} if it is missing or unreadable."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError):
+        logger.warning("Ignoring unreadable state file %s", path)
+        return {}
+
+
+def write_json(path: str, payload):
+    """Replace ``path`` atomically, so readers never see a partial file."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def locked_json_update(path: str, update: Callable[[dict], dict]) -> dict:
+    """Re-read ``path``, apply ``update`` and write the result back under an flock on ``<path>.lock``.
+
+    Processes sharing the file merge their changes instead of overwriting each
+    other's. Returns the dict that was written.
+    """
+    with file_lock(path + ".lock"):
+        data = update(read_json(path))
+        write_json(path, data)
+    return data